@@ -0,0 +1,75 @@
+"""Move scoring for the computer opponent.
+
+Every placement open to the player on turn (hand card x empty cell) is
+scored in one pass of array math instead of running check_duels once per
+candidate:
+
+- captures: for each cell, the element every neighbour is compared on and
+  the value it defends with, masked to the neighbours an opponent owns; a
+  card captures where its value on that element is at least as high;
+- exposure: how weak the card is on the sides that face cells still empty,
+  where the opponent could place against it later.
+
+A capture is worth more than any exposure, which only breaks ties.
+"""
+import numpy as np
+
+from engine import CharacterCard
+
+ROWS, COLS = 3, 5
+CELLS = ROWS * COLS
+ELEMENTS = ('Fire', 'Water', 'Air', 'Earth')
+MAX_STAT = 5  # highest element value a dealt card has
+CAPTURE_WEIGHT = 2.0  # a capture swings the card count by two
+EXPOSURE_WEIGHT = 0.1  # per point a side facing an empty cell is below MAX_STAT
+
+# Same pairing as Game.check_duels: (row step, col step, element compared)
+DIRECTIONS = ((-1, 0, 0), (1, 0, 1), (0, -1, 3), (0, 1, 2))
+ELEMENT = np.array([element for _, _, element in DIRECTIONS])
+
+# NEIGHBOUR[cell, direction] is the adjacent cell, or CELLS (a padding row
+# that is never empty or owned) off the edge of the board
+NEIGHBOUR = np.full((CELLS, len(DIRECTIONS)), CELLS)
+for _cell in range(CELLS):
+    for _d, (_dr, _dc, _) in enumerate(DIRECTIONS):
+        _row, _col = _cell // COLS + _dr, _cell % COLS + _dc
+        if 0 <= _row < ROWS and 0 <= _col < COLS:
+            NEIGHBOUR[_cell, _d] = _row * COLS + _col
+
+
+def evaluate(hand, board, opponent, empty):
+    """Score every placement of `hand` (n x 4 element values, in ELEMENTS
+    order) on a board of CELLS cells: `board` holds each cell's element
+    values, `opponent` marks cells with an opponent's card and `empty` the
+    open cells. Returns (captures, scores), both n x CELLS; scores are -inf
+    on occupied cells."""
+    padded_board = np.vstack([board, np.zeros((1, 4), dtype=board.dtype)])
+    defend = padded_board[NEIGHBOUR, ELEMENT]  # CELLS x 4: value each neighbour defends with
+    capturable = np.append(opponent, False)[NEIGHBOUR]
+    open_sides = np.append(empty, False)[NEIGHBOUR]
+
+    attack = hand[:, ELEMENT]  # n x 4: each card's value toward each direction
+    captures = ((attack[:, None, :] >= defend[None]) & capturable[None]).sum(axis=2)
+    exposure = ((MAX_STAT - attack[:, None, :]) * open_sides[None]).sum(axis=2)
+    scores = CAPTURE_WEIGHT * captures - EXPOSURE_WEIGHT * exposure
+    scores[:, ~empty] = -np.inf
+    return captures, scores
+
+def best_placement(game):
+    """(card, row, col) with the best score for the player on turn, or None
+    if they hold no character card or the board is full. Ties go to the
+    earlier card, then the earlier cell."""
+    player = game.player1 if game.current_turn == game.player1.name else game.player2
+    cards = [card for card in player.hand if isinstance(card, CharacterCard)]
+    cells = [card for row in game.grid for card in row]
+    empty = np.array([card is None for card in cells])
+    if not cards or not empty.any():
+        return None
+
+    hand = np.array([[card.elements[e] for e in ELEMENTS] for card in cards])
+    board = np.array([[card.elements[e] for e in ELEMENTS] if isinstance(card, CharacterCard) else [0] * 4
+                      for card in cells])
+    opponent = np.array([isinstance(card, CharacterCard) and card.owner != player.name for card in cells])
+    _, scores = evaluate(hand, board, opponent, empty)
+    index, cell = np.unravel_index(np.argmax(scores), scores.shape)
+    return cards[index], int(cell) // COLS, int(cell) % COLS
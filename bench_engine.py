@@ -0,0 +1,204 @@
+"""Micro-benchmarks for the game engine hot paths.
+
+    python bench_engine.py                        # run everything
+    python bench_engine.py -k play_card           # only matching benchmarks
+    python bench_engine.py --save baseline.json   # record a baseline
+    python bench_engine.py --compare baseline.json --threshold 0.15
+
+--compare exits with status 1 when any benchmark is more than `threshold`
+slower than the baseline. Boards are built from a fixed seed so every run
+measures the same positions.
+"""
+import argparse
+import copy
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+
+from ai import best_placement
+from engine import Game, Player, CharacterCard, create_deck
+from solver import EndgameSolver
+
+SEED = 1234
+PLAYER1 = 'Alice'
+PLAYER2 = 'Computer'
+
+
+def build_board(cards_on_board, seed=SEED):
+    # Play alternating first-card moves into random cells until the board
+    # holds the requested number of cards
+    random.seed(seed)
+    game = Game(PLAYER1, PLAYER2, seed=seed)
+    cells = [(r, c) for r in range(3) for c in range(5)]
+    random.shuffle(cells)
+    for row, col in cells[:cards_on_board]:
+        player = game.player1 if game.current_turn == PLAYER1 else game.player2
+        if not player.hand:
+            player.draw_card()
+        card = player.hand[0]
+        game.grid[row][col] = card
+        card.owner = player.name
+        player.hand.remove(card)
+        game.check_duels(row, col, card)
+        player.draw_card()
+        game.current_turn = PLAYER2 if game.current_turn == PLAYER1 else PLAYER1
+    return game
+
+def first_empty_cell(game):
+    for row in range(3):
+        for col in range(5):
+            if game.grid[row][col] is None:
+                return row, col
+
+def play_first_card(game):
+    player = game.player1 if game.current_turn == PLAYER1 else game.player2
+    row, col = first_empty_cell(game)
+    game.play_card(player.hand[0].to_json(), row, col, player.name)
+
+def duel_setup(game):
+    game = copy.deepcopy(game)
+    row, col = first_empty_cell(game)
+    card = CharacterCard('Probe', 'Light', 5, 5, 5, 5)
+    card.owner = PLAYER1
+    game.grid[row][col] = card
+    return game, row, col, card
+
+def full_board(game):
+    game = copy.deepcopy(game)
+    while first_empty_cell(game):
+        row, col = first_empty_cell(game)
+        card = CharacterCard('Filler', 'Dark', 3, 3, 3, 3)
+        card.owner = PLAYER2
+        game.grid[row][col] = card
+    return game
+
+
+def benchmarks():
+    mid = build_board(7)
+    late = build_board(14)
+    states = {'mid': mid, 'late': late}
+    cases = {
+        'create_deck': (lambda _: create_deck('Light'), None),
+        'Game.__init__': (lambda _: Game(PLAYER1, PLAYER2), None),
+        'Player.draw_card': (lambda player: player.draw_card(), lambda: copy.deepcopy(mid.player1)),
+        'Player.draw_specific_cards': (
+            lambda player: player.draw_specific_cards(5, 0),
+            lambda: Player(PLAYER1, create_deck('Light'))
+        ),
+    }
+    for stage, game in states.items():
+        state = game.to_json()
+        compact = game.to_state()
+        cases[f'Game.to_json[{stage}]'] = (lambda _, g=game: g.to_json(), None)
+        cases[f'Game.from_json[{stage}]'] = (lambda _, s=state: Game.from_json(s), None)
+        cases[f'Game.to_state[{stage}]'] = (lambda _, g=game: g.to_state(), None)
+        cases[f'Game.from_state[{stage}]'] = (lambda _, s=compact: Game.from_state(s), None)
+        cases[f'play_card[{stage}]'] = (play_first_card, lambda g=game: copy.deepcopy(g))
+        cases[f'check_duels[{stage}]'] = (lambda args: args[0].check_duels(*args[1:]), lambda g=game: duel_setup(g))
+        cases[f'check_winner[{stage}]'] = (lambda g: g.check_winner(), lambda g=game: copy.deepcopy(g))
+        cases[f'best_placement[{stage}]'] = (lambda _, g=game: best_placement(g), None)
+    cases['check_winner[full]'] = (lambda g: g.check_winner(), lambda: full_board(late))
+
+    # Five empty cells: a fresh search, then the same position from the cache
+    endgame = build_board(10)
+    solved = EndgameSolver()
+    solved.best_move(endgame)
+    cases['EndgameSolver.best_move[cold]'] = (lambda solver: solver.best_move(endgame), EndgameSolver)
+    cases['EndgameSolver.best_move[cached]'] = (lambda _: solved.best_move(endgame), None)
+    return cases
+
+
+def timed_run(fn, args):
+    # Like timeit, keep the garbage collector out of the timed region
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        return time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def measure(fn, setup, rounds, min_time):
+    """Return ops/sec for each round.
+
+    The batch size is calibrated so a round takes at least `min_time`, or
+    until per-call setup (which runs outside the timed region) gets too slow.
+    """
+    max_wall = 10 * min_time
+    batch = 1
+    while True:
+        wall_started = time.perf_counter()
+        args = [setup() if setup else None for _ in range(batch)]
+        elapsed = timed_run(fn, args)
+        wall = time.perf_counter() - wall_started
+        if elapsed >= min_time:
+            break
+        # Grow towards min_time, but expensive setups cap the batch so a
+        # round including setup stays within max_wall
+        wanted = batch * min_time / max(elapsed, 1e-9) * 1.2
+        allowed = batch * max_wall / max(wall, 1e-9)
+        new_batch = int(min(wanted, allowed, batch * 10))
+        if new_batch <= batch:
+            break
+        batch = new_batch
+
+    results = []
+    for _ in range(rounds):
+        args = [setup() if setup else None for _ in range(batch)]
+        results.append(batch / timed_run(fn, args))
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Game engine micro-benchmarks')
+    parser.add_argument('-k', dest='keyword', help='only run benchmarks whose name contains this')
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per round')
+    parser.add_argument('--save', metavar='FILE', help='write results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed slowdown before --compare fails')
+    args = parser.parse_args()
+
+    cases = benchmarks()
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<32}{'ops/sec':>14}{'spread':>9}{'baseline':>14}{'change':>9}")
+    for name, (fn, setup) in cases.items():
+        if args.keyword and args.keyword not in name:
+            continue
+        rounds = measure(fn, setup, args.rounds, args.min_time)
+        ops = statistics.median(rounds)
+        spread = (max(rounds) - min(rounds)) / ops
+        results[name] = ops
+        line = f"{name:<32}{ops:>14,.0f}{spread:>8.0%} "
+        if name in baseline:
+            change = ops / baseline[name] - 1
+            line += f"{baseline[name]:>13,.0f}{change:>+9.1%}"
+            if change < -args.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}: "
+              + ', '.join(regressions))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,25 @@
+# Primitives that behave correctly under both Socket.IO async modes.
+# With eventlet every socket shares one OS thread, so blocking work has to
+# be pushed to a real thread and waits have to yield to the hub instead of
+# blocking it. With the threading server the stdlib versions are right.
+import threading
+
+
+def is_eventlet(async_mode):
+    return async_mode == 'eventlet'
+
+def make_semaphore(count, async_mode):
+    if is_eventlet(async_mode):
+        from eventlet.semaphore import Semaphore
+        return Semaphore(count)
+    return threading.BoundedSemaphore(count)
+
+def make_lock(async_mode):
+    return make_semaphore(1, async_mode)
+
+def run_blocking(async_mode, fn, *args, **kwargs):
+    # Run CPU-bound or blocking work without stalling other greenthreads
+    if is_eventlet(async_mode):
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
@@ -0,0 +1,559 @@
+"""Game rules: cards, players, the board and the computer opponent.
+
+The engine has no Flask or database dependency. The server injects hooks
+to persist results and pay out rewards; simulators and benchmarks run it
+without any.
+
+Every game has a seed. Decks are generated from it, and the randomness used
+during move n comes from (seed, n), so a game saved with to_state() and
+rebuilt with from_state() continues exactly as the original would have.
+"""
+import random
+from functools import lru_cache
+
+DECK_SIZE = 20
+FACTIONS = ('Light', 'Dark')
+
+class Card:
+    def __init__(self, name):
+        self.name = name
+        self.is_captured = False
+        self.owner = None
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'is_captured': self.is_captured,
+            'owner': self.owner,
+            'type': self.__class__.__name__
+        }
+
+class CharacterCard(Card):
+    def __init__(self, name, faction, fire, water, air, earth):
+        super().__init__(name)
+        self.faction = faction
+        self.elements = {
+            'Fire': fire,
+            'Water': water,
+            'Air': air,
+            'Earth': earth
+        }
+
+    def to_json(self):
+        data = super().to_json()
+        data.update({
+            'faction': self.faction,
+            'elements': self.elements
+        })
+        return data
+
+class ActionCard(Card):
+    def __init__(self, name, effect_type, value):
+        super().__init__(name)
+        self.effect_type = effect_type
+        self.value = value
+
+    def to_json(self):
+        data = super().to_json()
+        data.update({
+            'effect_type': self.effect_type,
+            'value': self.value
+        })
+        return data
+
+class EffectCard(Card):
+    def __init__(self, name, element_bonuses, bonus_effect=None):
+        super().__init__(name)
+        self.element_bonuses = element_bonuses
+        self.bonus_effect = bonus_effect
+
+    def to_json(self):
+        data = super().to_json()
+        data.update({
+            'element_bonuses': self.element_bonuses,
+            'bonus_effect': self.bonus_effect
+        })
+        return data
+
+class Player:
+    def __init__(self, name, deck, rng=random):
+        self.name = name
+        self.cards = list(deck)  # Every card the player owns, in deck order
+        self.deck = deck
+        self.rng = rng
+        self.hand = []
+        self.discard_pile = []
+        self.active_effect = None
+        self.has_played_character = False
+        self.has_played_special = False
+
+    def draw_card(self):
+        if not self.deck:
+            if self.discard_pile:
+                self.deck = self.discard_pile
+                self.discard_pile = []
+                self.rng.shuffle(self.deck)
+            else:
+                return False
+        card = self.deck.pop(0)
+        if len(self.hand) < 10:
+            self.hand.append(card)
+            return True
+        else:
+            self.discard_pile.append(card)
+            return False
+
+    def draw_specific_cards(self, num_character, num_action):
+        # Separate deck into character cards only
+        character_cards = [c for c in self.deck if isinstance(c, CharacterCard)]
+        
+        # Make sure we have enough cards
+        if len(character_cards) < num_character:
+            self.rng.shuffle(self.deck)
+            character_cards = [c for c in self.deck if isinstance(c, CharacterCard)]
+        
+        # Draw specific number of character cards
+        drawn_characters = character_cards[:num_character]
+        
+        # Remove drawn cards from deck
+        for card in drawn_characters:
+            self.deck.remove(card)
+        
+        # Add to hand
+        self.hand.extend(drawn_characters)
+        
+        # Shuffle remaining deck
+        self.rng.shuffle(self.deck)
+        return True
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'hand': [card.to_json() for card in self.hand],
+            'deck_count': len(self.deck),
+            'discard_count': len(self.discard_pile),
+            'active_effect': self.active_effect.to_json() if self.active_effect else None
+        }
+
+class Game:
+    # on_game_over(game) is called once, when check_winner scores the full
+    # board; match_id ties the game to the row the server settles it through.
+    # computer_policy(game) picks the computer's placement as (card, row,
+    # col), or None to fall back to its first card in the first empty cell
+    def __init__(self, player1_name, player2_name, match_id=None, on_game_over=None, seed=None, deal=True):
+        self.match_id = match_id
+        self.on_game_over = on_game_over
+        self.computer_policy = None
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.move_count = 0
+        self.version = 0  # bumped by whoever saves a change; orders client updates
+        self.player1 = self.new_player(0, player1_name)
+        self.player2 = self.new_player(1, player2_name)
+        self.grid = [[None for _ in range(5)] for _ in range(3)]
+        self.current_turn = player1_name
+        self.winner = None
+        if deal:
+            self.initialize_game()
+
+    def rng(self, stream):
+        # Games rebuilt by from_json have no seed and fall back to fresh randomness
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f'{self.seed}:{self.move_count}:{stream}')
+
+    def new_player(self, side, name):
+        # The deck depends only on the seed, so from_state can regenerate it
+        deck = [CharacterCard(*stats) for stats in seeded_deck(self.seed, side)]
+        return Player(name, deck, self.rng(f'player{side + 1}'))
+
+    def next_move(self):
+        # Reseed both players before anything random happens in the move
+        self.move_count += 1
+        self.player1.rng = self.rng('player1')
+        self.player2.rng = self.rng('player2')
+
+    def initialize_game(self):
+        # Deal starting hands - 5 character cards only
+        self.player1.draw_specific_cards(5, 0)
+        self.player2.draw_specific_cards(5, 0)
+
+    @classmethod
+    def from_json(cls, data, on_game_over=None):
+        if not data:
+            return None
+        game = cls(data['player1']['name'], data['player2']['name'], data.get('match_id'), on_game_over)
+        # Cards are rebuilt from their stats rather than the seeded decks
+        game.seed = None
+        
+        # Clear initial hands since we'll rebuild them
+        game.player1.hand = []
+        game.player2.hand = []
+        
+        # Reconstruct player hands and active effects
+        for player_data in [data['player1'], data['player2']]:
+            player = game.player1 if player_data['name'] == game.player1.name else game.player2
+            
+            for card_data in player_data['hand']:
+                if card_data.get('type') == 'CardBack':
+                    continue
+                
+                if card_data['type'] == 'CharacterCard':
+                    card = CharacterCard(
+                        card_data['name'],
+                        card_data['faction'],
+                        card_data['elements']['Fire'],
+                        card_data['elements']['Water'],
+                        card_data['elements']['Air'],
+                        card_data['elements']['Earth']
+                    )
+                elif card_data['type'] == 'ActionCard':
+                    card = ActionCard(
+                        card_data['name'],
+                        card_data['effect_type'],
+                        card_data['value']
+                    )
+                elif card_data['type'] == 'EffectCard':
+                    card = EffectCard(
+                        card_data['name'],
+                        card_data['element_bonuses'],
+                        card_data.get('bonus_effect')
+                    )
+                player.hand.append(card)
+
+        # Set game state
+        game.current_turn = data['current_turn']
+        game.winner = data.get('winner')
+        game.version = data.get('version', 0)
+        if 'final_scores' in data:
+            game.final_scores = data['final_scores']
+
+        # Reconstruct grid
+        for row in range(3):
+            for col in range(5):
+                card_data = data['grid'][row][col]
+                if card_data:
+                    if card_data['type'] == 'CharacterCard':
+                        card = CharacterCard(
+                            card_data['name'],
+                            card_data['faction'],
+                            card_data['elements']['Fire'],
+                            card_data['elements']['Water'],
+                            card_data['elements']['Air'],
+                            card_data['elements']['Earth']
+                        )
+                    elif card_data['type'] == 'ActionCard':
+                        card = ActionCard(
+                            card_data['name'],
+                            card_data['effect_type'],
+                            card_data['value']
+                        )
+                    elif card_data['type'] == 'EffectCard':
+                        card = EffectCard(
+                            card_data['name'],
+                            card_data['element_bonuses'],
+                            card_data.get('bonus_effect')
+                        )
+                    else:
+                        continue
+                        
+                    card.is_captured = card_data['is_captured']
+                    card.owner = card_data['owner']
+                    game.grid[row][col] = card
+
+        return game
+
+    def to_json(self):
+        data = {
+            'match_id': self.match_id,
+            'player1': self.player1.to_json(),
+            'player2': self.player2.to_json(),
+            'grid': [[card.to_json() if card else None for card in row] for row in self.grid],
+            'current_turn': self.current_turn,
+            'winner': self.winner,
+            'version': self.version
+        }
+        
+        # Include final scores if game is over
+        if hasattr(self, 'final_scores'):
+            data['final_scores'] = self.final_scores
+            
+        return data
+
+    def to_state(self):
+        """Compact persisted form. Decks only hold character cards, so a card
+        is fully described by its position in the seeded deck; unlike to_json
+        this includes the seed and the deck order and must stay server side."""
+        if self.seed is None:
+            return self.to_json()
+        refs = {}
+        for side, player in enumerate((self.player1, self.player2)):
+            for i, card in enumerate(player.cards):
+                refs[id(card)] = side * DECK_SIZE + i
+        owners = {self.player1.name: 0, self.player2.name: 1}
+
+        state = {
+            'seed': self.seed,
+            'match_id': self.match_id,
+            'moves': self.move_count,
+            'players': [{
+                'name': player.name,
+                'deck': [refs[id(card)] for card in player.deck],
+                'hand': [refs[id(card)] for card in player.hand],
+                'discard': [refs[id(card)] for card in player.discard_pile],
+                'played': [player.has_played_character, player.has_played_special]
+            } for player in (self.player1, self.player2)],
+            'grid': [[[refs[id(card)], owners[card.owner], card.is_captured] if card else None for card in row]
+                     for row in self.grid],
+            'current_turn': self.current_turn,
+            'winner': self.winner,
+            'version': self.version
+        }
+        if hasattr(self, 'final_scores'):
+            state['final_scores'] = self.final_scores
+        return state
+
+    @classmethod
+    def from_state(cls, state, on_game_over=None):
+        player1, player2 = state['players']
+        game = cls(player1['name'], player2['name'], state.get('match_id'), on_game_over, state['seed'], deal=False)
+        game.move_count = state['moves']
+        cards = game.player1.cards + game.player2.cards
+        players = (game.player1, game.player2)
+        for player, data in zip(players, state['players']):
+            player.deck = [cards[ref] for ref in data['deck']]
+            player.hand = [cards[ref] for ref in data['hand']]
+            player.discard_pile = [cards[ref] for ref in data['discard']]
+            player.has_played_character, player.has_played_special = data['played']
+            player.rng = game.rng(f'player{players.index(player) + 1}')
+
+        for row, cells in enumerate(state['grid']):
+            for col, cell in enumerate(cells):
+                if cell:
+                    ref, owner, is_captured = cell
+                    card = cards[ref]
+                    card.owner = players[owner].name
+                    card.is_captured = is_captured
+                    game.grid[row][col] = card
+
+        game.current_turn = state['current_turn']
+        game.winner = state['winner']
+        game.version = state.get('version', 0)
+        if 'final_scores' in state:
+            game.final_scores = state['final_scores']
+        return game
+
+    def check_duels(self, row, col, card):
+        # Map (dx,dy) to the element to compare
+        element_pairs = {
+            (-1, 0): ('Fire', 'Fire'),     # Card above: our top Fire vs their bottom Fire
+            (1, 0): ('Water', 'Water'),    # Card below: our bottom Water vs their top Water
+            (0, -1): ('Earth', 'Earth'),   # Card to left: our left Earth vs their right Earth
+            (0, 1): ('Air', 'Air')         # Card to right: our right Air vs their left Air
+        }
+        
+        # Check all adjacent positions
+        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:  # up, down, left, right
+            new_row, new_col = row + dx, col + dy
+            if 0 <= new_row < 3 and 0 <= new_col < 5:
+                opponent_card = self.grid[new_row][new_col]
+                if opponent_card and isinstance(opponent_card, CharacterCard):
+                    # Only check opponent's cards
+                    if opponent_card.owner != card.owner:
+                        our_element, their_element = element_pairs[(dx, dy)]
+                        
+                        # Compare the adjacent values
+                        our_value = card.elements[our_element]
+                        their_value = opponent_card.elements[their_element]
+                        
+                        # Only capture if our value is greater than or equal to their value
+                        if our_value >= their_value:
+                            opponent_card.owner = card.owner  # Change ownership
+                            opponent_card.is_captured = False # Reset capture state
+                        # If our value is less, do nothing - leave the card as is
+
+    def check_winner(self):
+        # A decided game is only scored once
+        if self.winner:
+            return
+
+        # Check if the board is full (15 cards)
+        total_cards = sum(1 for row in self.grid for card in row if card)
+        if total_cards == 15:  # 3x5 grid filled
+            player1_cards, player2_cards = self.scores()
+            
+            # Determine winner based on total cards
+            if player1_cards > player2_cards:
+                self.winner = self.player1.name
+            elif player2_cards > player1_cards:
+                self.winner = self.player2.name
+            else:
+                self.winner = 'Tie'
+            
+            # Add the scores to the game state for the announcement
+            self.final_scores = {
+                'player1': {
+                    'name': self.player1.name,
+                    'cards': player1_cards
+                },
+                'player2': {
+                    'name': self.player2.name,
+                    'cards': player2_cards
+                }
+            }
+            
+            self.running = False
+
+            if self.on_game_over:
+                self.on_game_over(self)
+
+    def scores(self):
+        # Character cards each player owns on the board
+        player1_cards = 0
+        player2_cards = 0
+        for row in self.grid:
+            for card in row:
+                if isinstance(card, CharacterCard):
+                    if card.owner == self.player1.name:
+                        player1_cards += 1
+                    elif card.owner == self.player2.name:
+                        player2_cards += 1
+        return player1_cards, player2_cards
+
+    def end_turn(self):
+        current_player = self.player1 if self.current_turn == self.player1.name else self.player2
+        
+        # Reset turn flags
+        current_player.has_played_character = False
+        current_player.has_played_special = False
+        
+        # Draw card for next turn
+        current_player.draw_card()
+        
+        # Check if this was the last turn (board is full)
+        total_cards = sum(1 for row in self.grid for card in row if card)
+        if total_cards == 15:  # Board is full
+            self.check_winner()  # This will set the winner and final scores
+            return
+        
+        # If not the last turn, switch turns normally
+        self.current_turn = self.player2.name if self.current_turn == self.player1.name else self.player1.name
+
+        # If next player is computer, trigger its turn
+        if self.current_turn == 'Computer':
+            self.play_computer_turn()
+
+    def play_card(self, card_data, row, col, player_name):
+        if self.current_turn != player_name:
+            return False, "Not your turn"
+        
+        current_player = self.player1 if player_name == self.player1.name else self.player2
+        
+        # Find the actual card object from the card data
+        card = None
+        for hand_card in current_player.hand:
+            if hand_card.name == card_data['name']:
+                card = hand_card
+                break
+        
+        if not card:
+            return False, "Card not found in hand"
+
+        # Check if it's a valid play
+        if isinstance(card, CharacterCard) and self.grid[row][col] is not None:
+            return False, "Cell is occupied"
+        if isinstance(card, (ActionCard, EffectCard)) and not current_player.has_played_character:
+            return False, "Must play a character card first"
+
+        self.next_move()
+        if isinstance(card, CharacterCard):
+            self.grid[row][col] = card
+            card.owner = player_name
+            current_player.hand.remove(card)
+            current_player.has_played_character = True
+            self.check_duels(row, col, card)
+                
+        elif isinstance(card, (ActionCard, EffectCard)):
+            self.apply_special_card(card, current_player)
+            current_player.hand.remove(card)
+            current_player.has_played_special = True
+            
+        return True, "Card played successfully"
+
+    def apply_special_card(self, card, player):
+        if isinstance(card, ActionCard):
+            if card.effect_type == 'boost':
+                for row in self.grid:
+                    for cell in row:
+                        if isinstance(cell, CharacterCard) and cell.owner == player.name:
+                            for element in cell.elements:
+                                cell.elements[element] += card.value
+            elif card.effect_type == 'extra_draw':
+                for _ in range(card.value):
+                    player.draw_card()
+        elif isinstance(card, EffectCard):
+            if player.active_effect:
+                player.discard_pile.append(player.active_effect)
+            player.active_effect = card
+
+    def computer_placement(self):
+        # The character card the computer plays and where, or None
+        if self.computer_policy:
+            choice = self.computer_policy(self)
+            if choice:
+                return choice
+        return first_empty_cell(self)
+
+    def play_computer_turn(self):
+        computer = self.player2
+        
+        # Try to play a character card first
+        if not computer.has_played_character:
+            placement = self.computer_placement()
+            if placement:
+                card, row, col = placement
+                self.play_card(card.to_json(), row, col, 'Computer')
+        
+        # End turn after placing a character card, or if none was played
+        self.end_turn()
+
+def first_empty_cell(game):
+    # The default policy: the first character card of the player on turn in
+    # the first empty cell
+    player = game.player1 if game.current_turn == game.player1.name else game.player2
+    character_cards = [c for c in player.hand if isinstance(c, CharacterCard)]
+    if character_cards:
+        # Find first empty cell
+        for row in range(3):
+            for col in range(5):
+                if game.grid[row][col] is None:
+                    return character_cards[0], row, col
+    return None
+
+def create_deck(faction, rng=random):
+    deck = []
+    
+    # Create character cards only
+    for i in range(DECK_SIZE):
+        name = f"{faction} Creature {i+1}"
+        if faction == 'Light':
+            fire = rng.randint(2, 5)
+            water = rng.randint(1, 4)
+            air = rng.randint(2, 5)
+            earth = rng.randint(1, 4)
+        else:
+            fire = rng.randint(1, 4)
+            water = rng.randint(2, 5)
+            air = rng.randint(1, 4)
+            earth = rng.randint(2, 5)
+        
+        card = CharacterCard(name, faction, fire, water, air, earth)
+        deck.append(card)
+    
+    rng.shuffle(deck)
+    return deck
+
+@lru_cache(maxsize=1024)
+def seeded_deck(seed, side):
+    # Card stats in deck order; cached so rebuilding a game skips the RNG
+    deck = create_deck(FACTIONS[side], random.Random(f'{seed}:deck:{side}'))
+    return tuple((card.name, card.faction, *card.elements.values()) for card in deck)
@@ -0,0 +1,33 @@
+"""Extensions and process-wide helpers.
+
+They are created unbound here and attached to the application in
+main.create_app(), so modules can import them without building an app.
+"""
+from flask_login import LoginManager
+from flask_socketio import SocketIO
+from flask_sqlalchemy import SQLAlchemy
+
+from hashing import PasswordHasher
+from metrics import Metrics, instrument_socketio, instrument_sqlalchemy
+from sampler import SamplingProfiler
+from watchdog import LoopWatchdog
+
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+socketio = SocketIO()
+
+# Latency, query and payload metrics, served on /metrics. Socket handlers
+# are only timed if they are declared after instrument_socketio
+metrics = Metrics()
+instrument_socketio(socketio, metrics)
+instrument_sqlalchemy(metrics)
+
+# Sampling profiler, off until toggled via /admin/profiler or SIGUSR2
+profiler = SamplingProfiler()
+
+# Event-loop lag, stalls and per-handler blocking time, started with the server
+watchdog = LoopWatchdog(metrics)
+
+# Configured from the app config by create_app
+password_hasher = PasswordHasher()
@@ -0,0 +1,51 @@
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+from concurrency import make_semaphore, run_blocking
+
+
+def stored_method(method):
+    # The method prefix werkzeug writes into hashes made with `method`: PBKDF2
+    # without an iteration count is stored with the default count filled in
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+class PasswordHasher:
+    """Password hashing that stays off the event loop.
+
+    Hash and verify calls run in a native thread under eventlet, and at most
+    `max_concurrent` of them run at once so a login wave queues up instead
+    of starving the game traffic of CPU.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:260000', salt_length=16, max_concurrent=4, async_mode='threading'):
+        self.method = method
+        self.salt_length = salt_length
+        self.async_mode = async_mode
+        self.slots = make_semaphore(max_concurrent, async_mode)
+
+    def init_app(self, app, async_mode):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.salt_length = app.config['PASSWORD_HASH_SALT_LENGTH']
+        self.async_mode = async_mode
+        self.slots = make_semaphore(app.config['PASSWORD_HASH_MAX_CONCURRENT'], async_mode)
+
+    def _run(self, fn, *args, **kwargs):
+        with self.slots:
+            return run_blocking(self.async_mode, fn, *args, **kwargs)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # Werkzeug hashes look like "method$salt$hash"
+        parts = pwhash.split('$') if pwhash else []
+        if len(parts) != 3:
+            return True
+        method, salt, _ = parts
+        return method != stored_method(self.method) or len(salt) != self.salt_length
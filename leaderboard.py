@@ -0,0 +1,99 @@
+from bisect import bisect_left, insort
+from threading import Lock
+
+
+class Leaderboard:
+    """In-memory rank index over player ratings.
+
+    Entries are kept in a sorted array keyed by (-rating, user_id), so the
+    best player is always at position 0 and ties are broken by the older
+    account. Rank lookups are a binary search instead of a rating scan;
+    a rating change deletes and re-inserts its key, which shifts the list
+    and costs O(n).
+    """
+
+    def __init__(self):
+        self.keys = []      # sorted (-rating, user_id)
+        self.players = {}   # user_id -> {'username', 'rating'}
+        self.changed = False  # set when ranks moved since the last snapshot
+        self.loaded = False
+        self.lock = Lock()
+
+    def load(self, rows):
+        # rows: iterable of (user_id, username, rating)
+        with self.lock:
+            self.players = {
+                user_id: {'username': username, 'rating': rating}
+                for user_id, username, rating in rows
+            }
+            self.keys = sorted((-p['rating'], user_id) for user_id, p in self.players.items())
+            self.changed = True
+            self.loaded = True
+
+    def update(self, user_id, username, rating):
+        with self.lock:
+            current = self.players.get(user_id)
+            if current:
+                if current['rating'] == rating and current['username'] == username:
+                    return
+                self._remove_key(user_id, current['rating'])
+            self.players[user_id] = {'username': username, 'rating': rating}
+            insort(self.keys, (-rating, user_id))
+            self.changed = True
+
+    def remove(self, user_id):
+        with self.lock:
+            current = self.players.pop(user_id, None)
+            if current:
+                self._remove_key(user_id, current['rating'])
+                self.changed = True
+
+    def _remove_key(self, user_id, rating):
+        index = bisect_left(self.keys, (-rating, user_id))
+        if index < len(self.keys) and self.keys[index] == (-rating, user_id):
+            del self.keys[index]
+
+    def _entry(self, position):
+        user_id = self.keys[position][1]
+        player = self.players[user_id]
+        return {
+            'rank': position + 1,
+            'user_id': user_id,
+            'username': player['username'],
+            'rating': player['rating']
+        }
+
+    def _position(self, user_id):
+        player = self.players.get(user_id)
+        if not player:
+            return None
+        return bisect_left(self.keys, (-player['rating'], user_id))
+
+    def top(self, n=10):
+        with self.lock:
+            return [self._entry(i) for i in range(min(n, len(self.keys)))]
+
+    def rank(self, user_id):
+        with self.lock:
+            position = self._position(user_id)
+            return None if position is None else position + 1
+
+    def around(self, user_id, radius=5):
+        with self.lock:
+            position = self._position(user_id)
+            if position is None:
+                return []
+            start = max(0, position - radius)
+            end = min(len(self.keys), position + radius + 1)
+            return [self._entry(i) for i in range(start, end)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def snapshot(self):
+        # Full ordered ranking if anything changed since the last snapshot
+        with self.lock:
+            if not self.changed:
+                return None
+            self.changed = False
+            return [self._entry(i) for i in range(len(self.keys))]
@@ -0,0 +1,93 @@
+from sqlalchemy import func
+
+
+class CoinLedger:
+    """SmashCoins bookkeeping.
+
+    Every balance change is a single `UPDATE ... SET smash_coins = smash_coins + ?`
+    plus an append-only transaction row, staged on the current session. The
+    caller commits, so several movements can settle in one transaction.
+    """
+
+    def __init__(self, db, user_model, transaction_model, on_change=None):
+        self.db = db
+        self.User = user_model
+        self.Transaction = transaction_model
+        self.on_change = on_change  # called with the user id after each balance update
+
+    def _record(self, user_id, amount, reason, match_id=None):
+        if self.on_change:
+            self.on_change(user_id)
+        self.db.session.add(self.Transaction(
+            user_id=user_id,
+            amount=amount,
+            reason=reason,
+            match_id=match_id
+        ))
+
+    def open_account(self, user_id, balance, reason='Starting coins'):
+        # Records the balance a new account was created with
+        self._record(user_id, balance, reason)
+
+    def credit(self, user_id, amount, reason, match_id=None):
+        User = self.User
+        updated = User.query.filter(User.id == user_id).update(
+            {User.smash_coins: User.smash_coins + amount},
+            synchronize_session=False
+        )
+        if updated:
+            self._record(user_id, amount, reason, match_id)
+        return updated == 1
+
+    def debit(self, user_id, amount, reason, match_id=None):
+        # Only succeeds if the balance covers the amount at write time
+        User = self.User
+        updated = User.query.filter(User.id == user_id, User.smash_coins >= amount).update(
+            {User.smash_coins: User.smash_coins - amount},
+            synchronize_session=False
+        )
+        if updated:
+            self._record(user_id, -amount, reason, match_id)
+        return updated == 1
+
+    def balances(self, user_ids):
+        User = self.User
+        rows = self.db.session.query(User.id, User.smash_coins).filter(User.id.in_(user_ids)).all()
+        return dict(rows)
+
+    def open_missing_accounts(self, reason='Opening balance'):
+        # Accounts that predate the ledger start it from their current
+        # balance. Run before the server takes traffic: once a credit or debit
+        # is recorded first, the account can never be opened at the right
+        # balance. Returns how many were opened
+        User, Transaction = self.User, self.Transaction
+        rows = self.db.session.query(User.id, User.smash_coins).filter(
+            ~self.db.session.query(Transaction.id).filter(Transaction.user_id == User.id).exists()
+        ).all()
+        for user_id, balance in rows:
+            self.open_account(user_id, balance or 0, reason)
+        return len(rows)
+
+    def reconcile(self):
+        """Check every balance against its ledger history.
+
+        Accounts that predate the ledger get an opening entry for their current
+        balance. Returns (user_id, balance, ledger_total) for the accounts that
+        do not add up.
+        """
+        User, Transaction = self.User, self.Transaction
+        rows = self.db.session.query(
+            User.id,
+            User.smash_coins,
+            func.coalesce(func.sum(Transaction.amount), 0),
+            func.count(Transaction.id)
+        ).outerjoin(Transaction, Transaction.user_id == User.id).group_by(User.id).all()
+
+        mismatches = []
+        for user_id, balance, ledger_total, entries in rows:
+            if entries == 0:
+                self.open_account(user_id, balance or 0, 'Opening balance')
+            elif balance != ledger_total:
+                mismatches.append((user_id, balance, ledger_total))
+        self.db.session.commit()
+        return mismatches
@@ -0,0 +1,241 @@
+"""Load generator for a running Smash&Clash server.
+
+Every simulated user registers, logs in, queues with find_match, plays its
+match to the end through submit_move, chats and spectates. Latency is
+recorded per HTTP endpoint and per Socket.IO event:
+
+    python loadtest.py --url http://localhost:5000 --users 50 --ramp-up 10
+
+Needs the packages in requirements-dev.txt.
+"""
+import argparse
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+import socketio
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+HEARTBEAT_INTERVAL = 10  # seconds between matchmaking heartbeats, as the lobby sends them
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # name -> [seconds]
+        self.errors = defaultdict(int)
+        self.started = time.time()
+
+    def record(self, name, seconds, ok=True):
+        with self.lock:
+            self.samples[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def timed(self, name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(name, time.perf_counter() - started, ok=False)
+            raise
+        self.record(name, time.perf_counter() - started)
+        return result
+
+    def report(self):
+        elapsed = time.time() - self.started
+        total = sum(len(samples) for samples in self.samples.values())
+        total_errors = sum(self.errors.values())
+        print(f"\n{'operation':<32}{'count':>8}{'errors':>8}{'err %':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name in sorted(self.samples):
+            samples = sorted(self.samples[name])
+            errors = self.errors[name]
+            print(f"{name:<32}{len(samples):>8}{errors:>8}{errors / len(samples) * 100:>8.1f}"
+                  f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 99) * 1000:>10.1f}"
+                  f"{samples[-1] * 1000:>10.1f}")
+        print(f"\n{total} operations in {elapsed:.1f}s: {total / elapsed:.1f} ops/s, "
+              f"{total_errors} errors ({total_errors / max(total, 1) * 100:.2f}%)")
+
+def percentile(sorted_samples, pct):
+    # Nearest-rank percentile
+    if not sorted_samples:
+        return 0
+    index = max(0, int(round(pct / 100 * len(sorted_samples))) - 1)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+class SimulatedUser(threading.Thread):
+    def __init__(self, base_url, username, stats, timeout=30, think_time=0.2):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = 'loadtest-' + username
+        self.stats = stats
+        self.timeout = timeout
+        self.think_time = think_time
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=False)
+        self.match_found = threading.Event()
+        self.state_changed = threading.Event()
+        self.match = None
+        self.find_started = None
+        self.sio.on('match_found', self.on_match_found)
+        self.sio.on('game_state_update', self.on_state_update)
+
+    # HTTP helpers
+    def http_call(self, name, method, path, expect=(200, 302), **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False,
+                                         timeout=self.timeout, **kwargs)
+            ok = response.status_code in expect
+            return response
+        finally:
+            self.stats.record(f"HTTP {method} {name}", time.perf_counter() - started, ok)
+
+    def submit_form(self, name, path, fields):
+        page = self.http_call(name, 'GET', path)
+        token = CSRF_TOKEN.search(page.text)
+        if token:
+            fields['csrf_token'] = token.group(1)
+        return self.http_call(name, 'POST', path, expect=(302,), data=fields)
+
+    # Socket helpers
+    def socket_call(self, event, data=None):
+        # Events are acked by the server once the handler returns
+        return self.stats.timed(f"WS {event}", self.sio.call, event, data, timeout=self.timeout)
+
+    def on_match_found(self, data):
+        if self.find_started:
+            self.stats.record('WS find_match -> match_found', time.perf_counter() - self.find_started)
+        self.match = data
+        self.match_found.set()
+
+    def on_state_update(self, data):
+        self.state_changed.set()
+
+    # Scenario
+    def run(self):
+        try:
+            self.register_and_login()
+            self.connect()
+            if self.find_match():
+                self.play_match()
+                self.chat()
+                self.spectate()
+        except Exception as e:
+            self.stats.record('user aborted', 0, ok=False)
+            print(f"{self.username}: {e}")
+        finally:
+            if self.sio.connected:
+                self.sio.disconnect()
+
+    def register_and_login(self):
+        self.submit_form('/register', '/register', {
+            'username': self.username,
+            'email': f'{self.username}@example.com',
+            'password': self.password,
+            'confirm_password': self.password
+        })
+        response = self.submit_form('/login', '/login', {
+            'username': self.username,
+            'password': self.password
+        })
+        if '/lobby' not in response.headers.get('Location', ''):
+            raise RuntimeError('login failed')
+
+    def connect(self):
+        cookies = '; '.join(f'{k}={v}' for k, v in self.http.cookies.items())
+        self.stats.timed('WS connect', self.sio.connect, self.base_url,
+                         headers={'Cookie': cookies}, transports=['websocket'])
+
+    def find_match(self):
+        self.find_started = time.perf_counter()
+        self.socket_call('find_match')
+        # The server drops a search that stops sending heartbeats; like the
+        # lobby, search again if it was dropped anyway
+        deadline = time.time() + self.timeout * 4
+        while not self.match_found.wait(min(HEARTBEAT_INTERVAL, max(0, deadline - time.time()))):
+            if time.time() >= deadline:
+                self.stats.record('WS find_match -> match_found', time.perf_counter() - self.find_started, ok=False)
+                return False
+            ack = self.socket_call('matchmaking_heartbeat')
+            if ack and not ack.get('queued') and not self.match_found.is_set():
+                self.socket_call('find_match')
+        return True
+
+    def get_state(self):
+        response = self.http_call('/game/<id>/state', 'GET', f"/game/{self.match['match_id']}/state", expect=(200,))
+        return response.json()
+
+    def play_match(self):
+        match_id = self.match['match_id']
+        self.http_call('/game/<id>', 'GET', f'/game/{match_id}', expect=(200,))
+        deadline = time.time() + self.timeout * 20
+        while time.time() < deadline:
+            state = self.get_state()
+            if state.get('winner'):
+                return
+            if state['current_turn'] != self.username:
+                self.state_changed.clear()
+                self.state_changed.wait(self.timeout)
+                continue
+
+            time.sleep(self.think_time)
+            me = 'player1' if state['player1']['name'] == self.username else 'player2'
+            hand = [c for c in state[me]['hand'] if c.get('type') == 'CharacterCard']
+            cells = [(r, c) for r in range(3) for c in range(5) if state['grid'][r][c] is None]
+            if not hand or not cells:
+                return
+            card = random.choice(hand)
+            row, col = random.choice(cells)
+            ack = self.socket_call('submit_move', {
+                'match_id': match_id, 'move_id': uuid.uuid4().hex, 'type': 'play_card',
+                'card': card, 'row': row, 'col': col
+            })
+            if not ack.get('ok'):
+                self.stats.record('move rejected', 0, ok=False)
+        self.stats.record('match timed out', 0, ok=False)
+
+    def chat(self):
+        # In-match chat only: private messages need a friendship, and the
+        # server has no endpoint for simulated users to become friends
+        match_id = self.match['match_id']
+        self.socket_call('game_message', {'match_id': match_id, 'message': 'gg'})
+
+    def spectate(self):
+        response = self.http_call('/api/live-matches', 'GET', '/api/live-matches', expect=(200,))
+        matches = response.json().get('matches') or [{'id': self.match['match_id']}]
+        match_id = random.choice(matches)['id']
+        self.socket_call('join_as_spectator', {'match_id': match_id})
+        self.socket_call('leave_as_spectator', {'match_id': match_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate players against a Smash&Clash server')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=20, help='number of simulated players (pairs up into matches)')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which users are started')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--think-time', type=float, default=0.2, help='seconds a user waits before each move')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:6]
+    stats = Stats()
+    users = [SimulatedUser(args.url, f'lt{run_id}_{i}', stats, args.timeout, args.think_time)
+             for i in range(args.users)]
+    delay = args.ramp_up / max(len(users), 1)
+    for user in users:
+        user.start()
+        time.sleep(delay)
+    for user in users:
+        user.join()
+    stats.report()
+
+if __name__ == '__main__':
+    main()
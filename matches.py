@@ -0,0 +1,98 @@
+"""Resident games and per-match move ordering.
+
+Each in-progress match keeps one Game in memory. Every change to it runs
+under that match's lock and is written back to the row before the lock is
+released, so concurrent moves on a match apply one after another instead of
+each mutating a private copy loaded from the row and the last commit
+winning. Locks are striped by match id: moves on different matches only
+wait for each other when their ids share a stripe.
+
+Ordering holds within one server process, which is how the game is served.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+from concurrency import make_lock
+
+
+class MatchStore:
+    def __init__(self, load, stripes=256, maxsize=4096):
+        self.load = load  # match row -> Game or None, reading the committed row
+        self.stripes = stripes
+        self.maxsize = maxsize
+        self.locks = [Lock() for _ in range(stripes)]
+        self.games = OrderedDict()  # match id -> resident Game, least recently used first
+        self.acks = OrderedDict()  # match id -> OrderedDict(move id -> ack) of recent moves
+        self.guard = Lock()  # guards games and acks, never held while waiting for a stripe
+
+    def init_app(self, async_mode):
+        # Stripe locks have to yield to the hub under eventlet
+        self.locks = [make_lock(async_mode) for _ in range(self.stripes)]
+
+    def lock(self, match_id):
+        return self.locks[hash(match_id) % self.stripes]
+
+    @contextmanager
+    def game(self, match):
+        """Hold the match's lock and yield its resident game, or None if the
+        match has no game yet (create one and keep() it). If the body raises,
+        the game is dropped so the next move starts from the saved row."""
+        with self.lock(match.id):
+            with self.guard:
+                game = self.games.get(match.id)
+                if game is not None:
+                    self.games.move_to_end(match.id)
+            if game is None:
+                game = self.load(match)
+                if game is not None:
+                    self.keep(match.id, game)
+            try:
+                yield game
+            except BaseException:
+                self.discard(match.id)
+                raise
+
+    def keep(self, match_id, game):
+        # Evicting another match's game is safe: it was saved by its last
+        # move, and is reloaded under that match's lock when needed again
+        with self.guard:
+            self.games[match_id] = game
+            self.games.move_to_end(match_id)
+            while len(self.games) > self.maxsize:
+                self.games.popitem(last=False)
+
+    def discard(self, match_id):
+        with self.guard:
+            self.games.pop(match_id, None)
+
+    def forget(self, match_id):
+        # A match that can take no more moves, retried or not
+        with self.guard:
+            self.games.pop(match_id, None)
+            self.acks.pop(match_id, None)
+
+    def resident(self):
+        # Ids of the matches holding a game or recent acks
+        with self.guard:
+            return list(self.games.keys() | self.acks.keys())
+
+    # Retried moves: a client that lost an ack resends the same move id and
+    # gets the original ack back instead of playing the move twice. Kept
+    # apart from the games so eviction doesn't forget them
+    def applied_move(self, match_id, move_id):
+        with self.guard:
+            return self.acks.get(match_id, {}).get(move_id)
+
+    def record_move(self, match_id, move_id, ack, keep=32):
+        with self.guard:
+            acks = self.acks.setdefault(match_id, OrderedDict())
+            self.acks.move_to_end(match_id)
+            acks[move_id] = ack
+            while len(acks) > keep:
+                acks.popitem(last=False)
+            while len(self.acks) > self.maxsize:
+                self.acks.popitem(last=False)
+
+    def __len__(self):
+        return len(self.games)
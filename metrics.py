@@ -0,0 +1,223 @@
+"""Latency, query and payload metrics exposed in Prometheus text format.
+
+instrument_app, instrument_socketio and instrument_sqlalchemy attach the
+collectors; render() produces the /metrics response body.
+"""
+import inspect
+import json
+import time
+from functools import wraps
+from threading import Lock
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PAYLOAD_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            for labels, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets + (float('inf'),), series[:-2] + [series[-1]]):
+                    yield (self.name + '_bucket',
+                           _format_labels(self.labelnames, labels, ('le', _format_value(float(bound)))),
+                           count)
+                yield self.name + '_sum', _format_labels(self.labelnames, labels), series[-2]
+                yield self.name + '_count', _format_labels(self.labelnames, labels), series[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self.collectors = []
+        self.http_latency = self.histogram(
+            'smash_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+        self.event_latency = self.histogram(
+            'smash_socketio_event_duration_seconds', 'Socket.IO event handler latency', ('event',))
+        self.db_queries = self.histogram(
+            'smash_db_queries_per_handler', 'SQL statements per request or socket event', ('handler',),
+            QUERY_COUNT_BUCKETS)
+        self.db_time = self.histogram(
+            'smash_db_time_per_handler_seconds', 'Time spent in SQL per request or socket event', ('handler',))
+        self.emit_bytes = self.histogram(
+            'smash_socketio_emit_bytes', 'Serialized size of emitted Socket.IO payloads', ('event',),
+            PAYLOAD_BUCKETS)
+        self.errors = self.counter(
+            'smash_errors_total', 'Errors caught and logged by the server', ('where',))
+        self.handler_hooks = []  # objects with handler_started(name) / handler_finished(name)
+
+    def counter(self, name, help, labelnames=()):
+        collector = Counter(name, help, labelnames)
+        self.collectors.append(collector)
+        return collector
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        collector = Histogram(name, help, labelnames, buckets)
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            lines.append(f'# HELP {collector.name} {collector.help}')
+            lines.append(f'# TYPE {collector.name} {collector.type}')
+            for name, labels, value in collector.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    # Per-handler bookkeeping shared by HTTP requests and socket events
+    def start_handler(self, handler):
+        g._metrics_started = time.perf_counter()
+        g._metrics_db_queries = 0
+        g._metrics_db_time = 0.0
+        for hook in self.handler_hooks:
+            hook.handler_started(handler)
+
+    def finish_handler(self, handler):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return None
+        for hook in self.handler_hooks:
+            hook.handler_finished(handler)
+        self.db_queries.observe(g.pop('_metrics_db_queries', 0), handler)
+        self.db_time.observe(g.pop('_metrics_db_time', 0.0), handler)
+        return time.perf_counter() - started
+
+
+def instrument_app(app, metrics):
+    @app.before_request
+    def start_request_timer():
+        metrics.start_handler(request.endpoint or 'unmatched')
+
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = request.endpoint or 'unmatched'
+        elapsed = metrics.finish_handler(endpoint)
+        if elapsed is not None:
+            metrics.http_latency.observe(elapsed, endpoint, request.method, str(response.status_code))
+        return response
+
+def _takes_arguments(handler):
+    try:
+        parameters = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    return any(parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD, parameter.VAR_POSITIONAL)
+               for parameter in parameters)
+
+def instrument_socketio(socketio, metrics):
+    """Time every handler registered through socketio.on from now on, and
+    record the size of every emitted payload. Call before defining handlers."""
+    register = socketio.on
+    emit = socketio.emit
+
+    def on(message, namespace=None):
+        def decorator(handler):
+            # Flask-SocketIO passes auth only to connect handlers that take it;
+            # decided here, so a TypeError raised by the handler isn't mistaken
+            # for a signature mismatch
+            drop_args = message == 'connect' and not _takes_arguments(handler)
+
+            @wraps(handler)
+            def timed_handler(*args):
+                metrics.start_handler(f'socket:{message}')
+                try:
+                    return handler() if drop_args else handler(*args)
+                finally:
+                    elapsed = metrics.finish_handler(f'socket:{message}')
+                    if elapsed is not None:
+                        metrics.event_latency.observe(elapsed, message)
+
+            register(message, namespace)(timed_handler)
+            return handler
+        return decorator
+
+    def measured_emit(event, *args, **kwargs):
+        try:
+            size = len(json.dumps(args, default=str))
+        except (TypeError, ValueError):
+            size = 0
+        metrics.emit_bytes.observe(size, event)
+        return emit(event, *args, **kwargs)
+
+    socketio.on = on
+    socketio.emit = measured_emit
+
+def instrument_sqlalchemy(metrics):
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_query_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_query_started'].pop()
+        if has_app_context() and '_metrics_started' in g:
+            g._metrics_db_queries += 1
+            g._metrics_db_time += time.perf_counter() - started
+
+    @event.listens_for(Engine, 'handle_error')
+    def discard_query_timer(context):
+        timers = context.connection.info.get('_metrics_query_started') if context.connection else None
+        if timers:
+            timers.pop()
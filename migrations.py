@@ -1,9 +1,11 @@
 import os
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from main import app, db, User, Match, ChatMessage, Friend
+from sqlalchemy import inspect, text
+from extensions import db
 
 def recreate_db():
+    from main import create_app
+    app = create_app()
+
     # Get the database file path
     db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
     
@@ -20,5 +22,18 @@ def recreate_db():
         db.create_all()
         print("Created new database with updated schema")
 
+def upgrade_schema():
+    # Bring a database created before a column was added up to date in
+    # place; create_all() only creates missing tables. Call in an app context
+    columns = {column['name'] for column in inspect(db.engine).get_columns('match')}
+    if 'last_move_at' not in columns:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE "match" ADD COLUMN last_move_at DATETIME'))
+            connection.execute(text('UPDATE "match" SET last_move_at = started_at'))
+        print("Added match.last_move_at")
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_match_open_last_move ON "match" (ended_at, last_move_at)'))
+
 if __name__ == '__main__':
-    recreate_db() 
\ No newline at end of file
+    recreate_db() 
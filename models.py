@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from flask_login import UserMixin
+
+from extensions import db, password_hasher
+
+# Database Models
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128))
+    rating = db.Column(db.Integer, default=1000)
+    games_played = db.Column(db.Integer, default=0)
+    games_won = db.Column(db.Integer, default=0)
+    smash_coins = db.Column(db.Integer, default=100)  # Starting coins
+
+    def set_password(self, password):
+        self.password_hash = password_hasher.hash(password)
+
+    def check_password(self, password):
+        return password_hasher.verify(self.password_hash, password)
+
+class Match(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    player1_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    player2_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    winner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ended_at = db.Column(db.DateTime, nullable=True)
+    last_move_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last saved game state
+    game_state = db.Column(db.JSON)
+    bet_amount = db.Column(db.Integer, default=0)  # Amount bet by each player
+    bet_locked = db.Column(db.Boolean, default=False)  # Whether betting is locked
+
+    # Open matches by last activity: the live list and the stale-match reaper
+    __table_args__ = (db.Index('ix_match_open_last_move', 'ended_at', 'last_move_at'),)
+
+class ChatMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), nullable=True)
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    message = db.Column(db.String(500))
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    is_read = db.Column(db.Boolean, default=False)
+
+class Friend(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    friend_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), default='pending')  # pending, accepted, blocked
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CoinTransaction(db.Model):
+    # Append-only SmashCoins ledger; a user's balance is the sum of their rows
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    amount = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(100))
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class LeaderboardEntry(db.Model):
+    # Periodic snapshot of the in-memory leaderboard
+    rank = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    username = db.Column(db.String(80))
+    rating = db.Column(db.Integer)
+    snapshot_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Add relationships to User model
+User.friends = db.relationship('Friend',
+    primaryjoin="or_(User.id==Friend.user_id, User.id==Friend.friend_id)",
+    lazy='dynamic')
+
+User.sent_messages = db.relationship('ChatMessage',
+    foreign_keys=[ChatMessage.sender_id],
+    backref='sender',
+    lazy='dynamic')
+
+User.received_messages = db.relationship('ChatMessage',
+    foreign_keys=[ChatMessage.receiver_id],
+    backref='receiver',
+    lazy='dynamic')
+
+User.matches_as_player1 = db.relationship('Match',
+    foreign_keys=[Match.player1_id],
+    backref='player1',
+    lazy='dynamic')
+
+User.matches_as_player2 = db.relationship('Match',
+    foreign_keys=[Match.player2_id],
+    backref='player2',
+    lazy='dynamic')
@@ -0,0 +1,131 @@
+"""SQL statement profiler and N+1 detector.
+
+In tests:
+
+    with profile_queries() as profile:
+        client.get('/api/player/alice')
+    profile.assert_max_queries(4)
+    profile.assert_no_n_plus_one()
+
+In development, init_app(app) profiles every request when QUERY_PROFILER is
+set, reports the count in an X-Query-Count header and logs repeated
+statements and QUERY_BUDGETS overruns.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+N_PLUS_ONE_THRESHOLD = 3
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryProfile:
+    def __init__(self):
+        self.statements = []  # (statement, parameters, seconds)
+
+    def record(self, statement, parameters, seconds):
+        self.statements.append((statement, parameters, seconds))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_time(self):
+        return sum(seconds for _, _, seconds in self.statements)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Statements run at least `threshold` times with different parameters,
+        the signature of a query issued once per row."""
+        runs = defaultdict(list)
+        for statement, parameters, _ in self.statements:
+            runs[statement].append(repr(parameters))
+        return [
+            (statement, len(params))
+            for statement, params in runs.items()
+            if len(params) >= threshold and len(set(params)) > 1
+        ]
+
+    def report(self):
+        lines = [f'{self.count} statements in {self.total_time * 1000:.1f}ms']
+        for statement, times in self.repeated():
+            lines.append(f'  repeated {times}x: {" ".join(statement.split())[:200]}')
+        return '\n'.join(lines)
+
+    def assert_max_queries(self, budget):
+        if self.count > budget:
+            raise QueryBudgetExceeded(f'Expected at most {budget} queries, got {self.report()}')
+
+    def assert_no_n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        if self.repeated(threshold):
+            raise QueryBudgetExceeded(f'N+1 query pattern detected: {self.report()}')
+
+
+_profiles = []  # profiles opened with profile_queries()
+
+@contextmanager
+def profile_queries():
+    profile = QueryProfile()
+    _profiles.append(profile)
+    try:
+        yield profile
+    finally:
+        _profiles.remove(profile)
+
+@contextmanager
+def query_budget(budget):
+    with profile_queries() as profile:
+        yield profile
+    profile.assert_max_queries(budget)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_profiler_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['_profiler_started'].pop()
+    for profile in _profiles:
+        profile.record(statement, parameters, seconds)
+    if has_app_context():
+        profile = g.get('_query_profile')
+        if profile is not None:
+            profile.record(statement, parameters, seconds)
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_timer(context):
+    timers = context.connection.info.get('_profiler_started') if context.connection else None
+    if timers:
+        timers.pop()
+
+
+def init_app(app):
+    if not app.config.get('QUERY_PROFILER'):
+        return
+
+    budgets = app.config.get('QUERY_BUDGETS', {})
+
+    @app.before_request
+    def start_query_profile():
+        g._query_profile = QueryProfile()
+
+    @app.after_request
+    def check_query_profile(response):
+        profile = g.pop('_query_profile', None)
+        if profile is None:
+            return response
+        response.headers['X-Query-Count'] = str(profile.count)
+        budget = budgets.get(request.endpoint)
+        if budget is not None and profile.count > budget:
+            app.logger.warning(f'{request.endpoint} exceeded its budget of {budget} queries: {profile.report()}')
+        elif profile.repeated():
+            app.logger.warning(f'Possible N+1 queries in {request.endpoint}: {profile.report()}')
+        return response
@@ -0,0 +1,55 @@
+# Flat rating swing applied when a player surrenders or forfeits
+SURRENDER_RATING_CHANGE = 20
+
+def get_k_factor(games_played):
+    if games_played < 10:
+        return 40  # Higher K-factor for new players
+    elif games_played < 30:
+        return 32  # Standard K-factor
+    else:
+        return 24  # Lower K-factor for experienced players
+
+def calculate_rating_change(winner_rating, loser_rating, k_factor=32):
+    # Using modified ELO rating system
+    # Calculate expected score using ELO formula
+    expected_score = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+
+    # Adjust K-factor based on rating difference
+    rating_diff = abs(winner_rating - loser_rating)
+    if rating_diff > 400:
+        k_factor *= 1.5  # Increase K-factor for large rating differences
+    elif rating_diff < 100:
+        k_factor *= 0.8  # Decrease K-factor for small rating differences
+
+    # Calculate base rating change
+    rating_change = round(k_factor * (1 - expected_score))
+
+    # Add bonus for beating higher-rated player
+    if winner_rating < loser_rating:
+        bonus = round((loser_rating - winner_rating) * 0.1)
+        rating_change += min(bonus, 15)  # Cap bonus at 15 points
+
+    return rating_change
+
+# Array versions of the functions above for batch recalculation.
+# Keep them in step with the scalar formulas when tweaking either. numpy is
+# imported on use so the game engine doesn't pay for it at startup.
+
+def get_k_factors(games_played):
+    import numpy as np
+    return np.where(games_played < 10, 40, np.where(games_played < 30, 32, 24))
+
+def calculate_rating_changes(winner_ratings, loser_ratings, k_factors):
+    import numpy as np
+    winner_ratings = winner_ratings.astype(np.float64)
+    loser_ratings = loser_ratings.astype(np.float64)
+    expected_scores = 1 / (1 + 10 ** ((loser_ratings - winner_ratings) / 400))
+
+    rating_diffs = np.abs(winner_ratings - loser_ratings)
+    k_factors = k_factors * np.where(rating_diffs > 400, 1.5, np.where(rating_diffs < 100, 0.8, 1.0))
+
+    # np.round rounds half to even, same as the builtin round()
+    rating_changes = np.round(k_factors * (1 - expected_scores)).astype(np.int64)
+
+    bonuses = np.minimum(np.round((loser_ratings - winner_ratings) * 0.1).astype(np.int64), 15)
+    return rating_changes + np.where(winner_ratings < loser_ratings, bonuses, 0)
@@ -0,0 +1,165 @@
+"""Recompute every player's rating by replaying finished matches.
+
+Run after changing the formulas in rating.py:
+
+    python rerate.py [--dry-run] [--batch-size 50000]
+
+Matches are streamed in the order they ended. Within each batch they are
+grouped into waves in which no player appears twice; a wave only depends on
+earlier waves, so it can be applied with array math while producing exactly
+the same ratings as replaying the matches one by one.
+"""
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import func
+
+from extensions import db
+from main import create_app
+from models import User, Match
+from rating import get_k_factors, calculate_rating_changes, SURRENDER_RATING_CHANGE
+
+DEFAULT_RATING = 1000
+
+# Match outcomes
+DECIDED = 0
+TIE = 1
+FORFEIT = 2  # Surrender: flat rating swing, no Elo
+
+class RatingReplay:
+    def __init__(self, user_ids):
+        self.index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.user_ids = np.array(user_ids, dtype=np.int64)
+        self.ratings = np.full(len(user_ids), DEFAULT_RATING, dtype=np.int64)
+        self.games_played = np.zeros(len(user_ids), dtype=np.int64)
+        self.games_won = np.zeros(len(user_ids), dtype=np.int64)
+        self.matches_replayed = 0
+
+    def classify(self, player1_id, player2_id, winner_id, state_winner):
+        # Returns (outcome, winner index, loser index) or None to skip the row
+        p1 = self.index.get(player1_id)
+        p2 = self.index.get(player2_id) if player2_id is not None else None
+        if p1 is None:
+            return None
+
+        if p2 is None:
+            # Games against the computer only count when surrendered
+            return (FORFEIT, None, p1) if state_winner is None else None
+
+        if state_winner == 'Tie' or winner_id not in (player1_id, player2_id):
+            return (TIE, p1, p2)
+
+        winner, loser = (p1, p2) if winner_id == player1_id else (p2, p1)
+        return (FORFEIT if state_winner is None else DECIDED, winner, loser)
+
+    def replay_batch(self, rows):
+        # Assign each match to the first wave after both players' previous match
+        last_wave = {}
+        waves = []
+        for row in rows:
+            result = self.classify(*row)
+            if result is None:
+                continue
+            outcome, winner, loser = result
+            wave = max(last_wave.get(winner, -1), last_wave.get(loser, -1)) + 1
+            if winner is not None:
+                last_wave[winner] = wave
+            last_wave[loser] = wave
+            if wave == len(waves):
+                waves.append([])
+            waves[wave].append(result)
+
+        for wave in waves:
+            self.apply_wave(wave)
+            self.matches_replayed += len(wave)
+
+    def apply_wave(self, wave):
+        outcomes = np.array([m[0] for m in wave])
+        winners = np.array([-1 if m[1] is None else m[1] for m in wave])
+        losers = np.array([m[2] for m in wave])
+
+        decided = outcomes == DECIDED
+        if decided.any():
+            w, l = winners[decided], losers[decided]
+            k_factors = np.minimum(get_k_factors(self.games_played[w]), get_k_factors(self.games_played[l]))
+            changes = calculate_rating_changes(self.ratings[w], self.ratings[l], k_factors)
+            self.ratings[w] = np.maximum(1, self.ratings[w] + changes)
+            self.ratings[l] = np.maximum(1, self.ratings[l] - changes)
+            self.games_won[w] += 1
+
+        forfeit = outcomes == FORFEIT
+        if forfeit.any():
+            l = losers[forfeit]
+            self.ratings[l] = np.maximum(1, self.ratings[l] - np.where(winners[forfeit] >= 0, SURRENDER_RATING_CHANGE, 0))
+            w = winners[forfeit]
+            w = w[w >= 0]
+            self.ratings[w] += SURRENDER_RATING_CHANGE
+            self.games_won[w] += 1
+
+        # Every outcome counts as a game played for everyone involved
+        self.games_played[losers] += 1
+        played = winners[winners >= 0]
+        self.games_played[played] += 1
+
+    def mappings(self):
+        return [{
+            'id': int(user_id),
+            'rating': int(rating),
+            'games_played': int(played),
+            'games_won': int(won)
+        } for user_id, rating, played, won in zip(self.user_ids, self.ratings, self.games_played, self.games_won)]
+
+def stream_matches(batch_size):
+    # Only the columns the replay needs; the winner name is pulled out of the
+    # JSON by SQLite instead of loading whole game states. Matches that were
+    # never dealt (closed by the stale-match reaper) were not played: rating
+    # them would count an abandoned lobby as a tie or a surrender
+    query = db.session.query(
+        Match.player1_id,
+        Match.player2_id,
+        Match.winner_id,
+        func.json_extract(Match.game_state, '$.winner')
+    ).filter(
+        Match.ended_at.isnot(None),
+        Match.game_state.isnot(None)
+    ).order_by(Match.ended_at, Match.id).yield_per(batch_size)
+
+    batch = []
+    for row in query:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def rerate(batch_size=50000, dry_run=False):
+    started = time.time()
+    user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+    replay = RatingReplay(user_ids)
+
+    for batch in stream_matches(batch_size):
+        replay.replay_batch(batch)
+        print(f"Replayed {replay.matches_replayed} matches ({time.time() - started:.1f}s)")
+
+    if not dry_run:
+        mappings = replay.mappings()
+        for i in range(0, len(mappings), batch_size):
+            db.session.bulk_update_mappings(User, mappings[i:i + batch_size])
+        db.session.commit()
+
+    print(f"Recalculated {len(user_ids)} players from {replay.matches_replayed} matches "
+          f"in {time.time() - started:.1f}s{' (dry run, nothing written)' if dry_run else ''}")
+    if not dry_run:
+        print("Restart the game server so the leaderboard picks up the new ratings")
+    return replay
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay match history to recompute ratings')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        rerate(args.batch_size, args.dry_run)
@@ -0,0 +1,154 @@
+"""Resuming dropped sockets.
+
+A mobile client that loses its connection used to come back as a stranger:
+the server had dropped its chats and rooms and the client refetched the
+whole game over HTTP. Now:
+
+- every connection gets a resume token. On disconnect its rooms are kept
+  for a grace period, and a reconnect presenting the token gets them back
+  without the user flapping offline and online for their friends;
+- every saved game state is recorded per match as a delta against the
+  previous one, so a client reporting the last version it saw is sent only
+  the deltas it missed, or the full state if the buffer doesn't reach back
+  that far.
+"""
+import secrets
+import time
+from collections import OrderedDict, defaultdict, deque
+from threading import Lock
+
+
+def list_delta(old, new):
+    # `new` as the items of `old` it keeps (indexes, in order) plus the items
+    # appended after them: a played card leaves a hand, a drawn one joins it
+    keep = []
+    start = 0
+    for item in new:
+        index = next((i for i in range(start, len(old)) if old[i] == item), None)
+        if index is None:
+            break
+        keep.append(index)
+        start = index + 1
+    return {'keep': keep, 'add': new[len(keep):]}
+
+def state_delta(old, new):
+    """Changes from one to_json() state to the next: changed top-level
+    fields in 'set', changed player fields in 'players', hands as
+    list_delta()s in 'hands' and changed board cells as [row, col, card]
+    in 'cells'."""
+    delta = {'base': old.get('version'), 'version': new.get('version'),
+             'set': {}, 'players': {}, 'hands': {}, 'cells': []}
+    for key, value in new.items():
+        if key == 'grid':
+            for row, (old_cells, new_cells) in enumerate(zip(old['grid'], value)):
+                for col, (old_card, new_card) in enumerate(zip(old_cells, new_cells)):
+                    if old_card != new_card:
+                        delta['cells'].append([row, col, new_card])
+        elif key in ('player1', 'player2') and isinstance(old.get(key), dict):
+            for field, field_value in value.items():
+                if old[key].get(field) == field_value:
+                    continue
+                if field == 'hand':
+                    delta['hands'][key] = list_delta(old[key]['hand'], field_value)
+                else:
+                    delta['players'].setdefault(key, {})[field] = field_value
+        elif old.get(key) != value:
+            delta['set'][key] = value
+    return delta
+
+
+class MatchEventLog:
+    def __init__(self, keep=64, maxsize=4096):
+        self.keep = keep
+        self.maxsize = maxsize
+        self.logs = OrderedDict()  # match id -> [latest state, deque of deltas]
+        self.lock = Lock()
+
+    def record(self, match_id, state):
+        with self.lock:
+            log = self.logs.get(match_id)
+            if log is None:
+                self.logs[match_id] = [state, deque(maxlen=self.keep)]
+            else:
+                log[1].append(state_delta(log[0], state))
+                log[0] = state
+            self.logs.move_to_end(match_id)
+            while len(self.logs) > self.maxsize:
+                self.logs.popitem(last=False)
+
+    def since(self, match_id, version):
+        """Deltas that bring a client at `version` up to date ([] if it is),
+        or None if they are no longer buffered."""
+        with self.lock:
+            log = self.logs.get(match_id)
+            if log is None or version is None:
+                return None
+            if version >= log[0]['version']:
+                return []
+            deltas = [delta for delta in log[1] if delta['version'] > version]
+            if not deltas or deltas[0]['base'] != version:
+                return None
+            return deltas
+
+    def discard(self, match_id):
+        with self.lock:
+            self.logs.pop(match_id, None)
+
+
+class ResumeRegistry:
+    def __init__(self, grace=30):
+        self.grace = grace
+        self.tokens = {}  # token -> {'user_id', 'sid', 'rooms', 'expires_at' (None while connected)}
+        self.by_sid = {}  # sid -> token
+        self.live = defaultdict(int)  # user id -> open connections
+        self.lock = Lock()
+
+    def issue(self, user_id, sid):
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.tokens[token] = {'user_id': user_id, 'sid': sid, 'rooms': [], 'expires_at': None}
+            self.by_sid[sid] = token
+            self.live[user_id] += 1
+        return token
+
+    def resume(self, token, user_id, sid):
+        """Move a token to a new connection. Returns the previous entry's
+        sid, rooms and whether it had already disconnected, or None if the
+        token is unknown, expired or someone else's."""
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None or entry['user_id'] != user_id:
+                return None
+            if entry['expires_at'] is not None and entry['expires_at'] < time.monotonic():
+                return None
+            previous = {'sid': entry['sid'], 'rooms': entry['rooms'], 'suspended': entry['expires_at'] is not None}
+            if previous['suspended']:
+                self.live[user_id] += 1
+            self.by_sid.pop(entry['sid'], None)
+            entry.update(sid=sid, rooms=[], expires_at=None)
+            self.by_sid[sid] = token
+            return previous
+
+    def suspend(self, sid, rooms):
+        # A connection dropped; keep its rooms until the grace period ends
+        with self.lock:
+            token = self.by_sid.pop(sid, None)
+            if token is None:
+                return False
+            entry = self.tokens[token]
+            entry.update(rooms=rooms, expires_at=time.monotonic() + self.grace)
+            self.live[entry['user_id']] -= 1
+            if not self.live[entry['user_id']]:
+                del self.live[entry['user_id']]
+            return True
+
+    def connected(self, user_id):
+        return self.live.get(user_id, 0) > 0
+
+    def expire(self):
+        # Drop suspended connections past their grace period; returns their user ids
+        now = time.monotonic()
+        with self.lock:
+            expired = [token for token, entry in self.tokens.items()
+                       if entry['expires_at'] is not None and entry['expires_at'] < now]
+            return [self.tokens.pop(token)['user_id'] for token in expired]
@@ -0,0 +1,630 @@
+from flask import Blueprint, Response, current_app, render_template, jsonify, request, flash, redirect, url_for
+from flask_login import login_user, login_required, logout_user, current_user
+from functools import wraps
+from datetime import datetime
+from ai import best_placement
+from engine import Game, CharacterCard
+from extensions import db, socketio, metrics, password_hasher, profiler, watchdog
+from forms import LoginForm, RegistrationForm
+from models import User, Match, ChatMessage, Friend
+from sessions import regenerate_session
+from services import online_players, users_by_id, get_leaderboard, sync_leaderboard, ledger, load_game, \
+    match_store, start_game, save_game, play_move, forfeit_match, endgame, player_view, player_views
+
+bp = Blueprint('main', __name__)
+
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def decorated(*args, **kwargs):
+        if current_user.username not in current_app.config['ADMIN_USERNAMES']:
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return decorated
+
+# Routes
+@bp.route('/')
+def index():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.lobby'))
+    form = LoginForm()
+    return render_template('login.html', form=form)
+
+@bp.route('/lobby')
+@login_required
+def lobby():
+    return render_template('lobby.html', username=current_user.username)
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.lobby'))
+    
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=form.username.data).first()
+        if user and user.check_password(form.password.data):
+            # Upgrade the stored hash if the hashing parameters changed
+            if password_hasher.needs_rehash(user.password_hash):
+                user.set_password(form.password.data)
+                db.session.commit()
+            login_user(user, remember=form.remember_me.data)
+            regenerate_session()
+            return redirect(url_for('main.lobby'))
+        flash('Invalid username or password', 'error')
+    return render_template('login.html', form=form)
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.lobby'))
+    
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        if User.query.filter_by(username=form.username.data).first():
+            flash('Username already exists', 'error')
+            return render_template('register.html', form=form)
+        
+        user = User(
+            username=form.username.data,
+            email=form.email.data
+        )
+        user.set_password(form.password.data)
+        db.session.add(user)
+        db.session.flush()
+        ledger.open_account(user.id, user.smash_coins)
+        db.session.commit()
+        sync_leaderboard(user)
+        
+        flash('Registration successful! Please login.', 'success')
+        return redirect(url_for('main.login'))
+    return render_template('register.html', form=form)
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    regenerate_session()
+    return redirect(url_for('main.index'))
+
+@bp.route('/profile')
+@login_required
+def profile():
+    # Get user's match history with proper joins
+    matches = Match.query.filter(
+        (Match.player1_id == current_user.id) | (Match.player2_id == current_user.id)
+    ).join(
+        User, 
+        (User.id == Match.player1_id) | (User.id == Match.player2_id)
+    ).order_by(Match.started_at.desc()).limit(10).all()
+    
+    # Calculate win rate
+    total_games = current_user.games_played
+    win_rate = (current_user.games_won / total_games * 100) if total_games > 0 else 0
+    
+    return render_template('profile.html', 
+        matches=matches,
+        win_rate=win_rate
+    )
+
+@bp.route('/update_profile', methods=['POST'])
+@login_required
+def update_profile():
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        
+        # Check if username is taken by another user
+        if username != current_user.username:
+            existing_user = User.query.filter_by(username=username).first()
+            if existing_user:
+                flash('Username already taken', 'error')
+                return redirect(url_for('main.profile'))
+        
+        # Check if email is taken by another user
+        if email != current_user.email:
+            existing_user = User.query.filter_by(email=email).first()
+            if existing_user:
+                flash('Email already registered', 'error')
+                return redirect(url_for('main.profile'))
+        
+        # Update user information
+        current_user.username = username
+        current_user.email = email
+        
+        try:
+            db.session.commit()
+            sync_leaderboard(current_user)
+            flash('Profile updated successfully', 'success')
+        except Exception as e:
+            db.session.rollback()
+            metrics.errors.inc('update_profile')
+            print(f"Error updating profile for user {current_user.id}: {str(e)}")
+            flash('An error occurred while updating your profile', 'error')
+        
+        return redirect(url_for('main.profile'))
+
+@bp.route('/change_password', methods=['POST'])
+@login_required
+def change_password():
+    if request.method == 'POST':
+        current_password = request.form.get('current_password')
+        new_password = request.form.get('new_password')
+        confirm_password = request.form.get('confirm_password')
+        
+        # Verify current password
+        if not current_user.check_password(current_password):
+            flash('Current password is incorrect', 'error')
+            return redirect(url_for('main.profile'))
+        
+        # Check if new passwords match
+        if new_password != confirm_password:
+            flash('New passwords do not match', 'error')
+            return redirect(url_for('main.profile'))
+        
+        # Update password
+        try:
+            current_user.set_password(new_password)
+            db.session.commit()
+            flash('Password changed successfully', 'success')
+        except Exception as e:
+            db.session.rollback()
+            metrics.errors.inc('change_password')
+            print(f"Error changing password for user {current_user.id}: {str(e)}")
+            flash('An error occurred while changing your password', 'error')
+        
+        return redirect(url_for('main.profile'))
+
+@bp.route('/api/chat/<username>')
+@login_required
+def get_chat_history(username):
+    other_user = User.query.filter_by(username=username).first_or_404()
+    
+    # Check if they are friends
+    friendship = Friend.query.filter(
+        ((Friend.user_id == current_user.id) & (Friend.friend_id == other_user.id)) |
+        ((Friend.user_id == other_user.id) & (Friend.friend_id == current_user.id)),
+        Friend.status == 'accepted'
+    ).first()
+    
+    if not friendship:
+        return jsonify({'error': 'Not friends with this user'}), 403
+    
+    # Get chat history
+    messages = ChatMessage.query.filter(
+        ((ChatMessage.sender_id == current_user.id) & (ChatMessage.receiver_id == other_user.id)) |
+        ((ChatMessage.sender_id == other_user.id) & (ChatMessage.receiver_id == current_user.id))
+    ).order_by(ChatMessage.timestamp.desc()).limit(50).all()
+    
+    # Build the response before committing: the commit expires every loaded
+    # row, and reading them afterwards would reload each one
+    history = [{
+        'from': current_user.username if msg.sender_id == current_user.id else other_user.username,
+        'message': msg.message,
+        'timestamp': msg.timestamp.isoformat(),
+        'is_read': msg.is_read or msg.receiver_id == current_user.id
+    } for msg in reversed(messages)]  # Reverse to show oldest first
+    
+    # Mark messages as read in one statement
+    ChatMessage.query.filter_by(
+        receiver_id=current_user.id,
+        sender_id=other_user.id,
+        is_read=False
+    ).update({'is_read': True}, synchronize_session=False)
+    
+    db.session.commit()
+    
+    return jsonify({'messages': history})
+
+# Game routes
+@bp.route('/game/<match_id>')
+@login_required
+def game(match_id):
+    match = Match.query.get_or_404(match_id)
+    
+    # Create new game state if not exists
+    if not match.game_state:
+        with match_store.game(match) as game:
+            if game is None:
+                start_game(match)
+    
+    return render_template('index.html', match_id=match_id)
+
+@bp.route('/new_game', methods=['POST'])
+@login_required
+def new_game():
+    try:
+        data = request.get_json()
+        game_mode = data.get('mode', 'player')
+        player1_name = current_user.username
+        player2_name = 'Computer' if game_mode == 'computer' else None
+        
+        # Create a new match in the database
+        match = Match(
+            player1_id=current_user.id,
+            player2_id=None,  # None for computer opponent
+            started_at=datetime.utcnow()
+        )
+        db.session.add(match)
+        db.session.commit()
+        
+        # Initialize game state
+        game = Game(player1_name, player2_name, match.id)
+        match.game_state = game.to_state()
+        db.session.commit()
+        
+        return jsonify({
+            'match_id': match.id,
+            'game_state': player_view(game.to_json(), player1_name)
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/play_card', methods=['POST'])
+@login_required
+def play_card():
+    try:
+        data = request.get_json()
+        match = Match.query.get_or_404(data['match_id'])
+        
+        if not match.game_state:
+            return jsonify({'error': 'Game not initialized'}), 400
+        
+        if match.ended_at:
+            return jsonify({'error': 'Game is over'}), 400
+        
+        # Moves on a match apply one at a time to its resident game
+        with match_store.game(match) as game:
+            if not game:
+                return jsonify({'error': 'Invalid game state'}), 400
+            # A surrender, forfeit or the reaper may have ended the match
+            # while this request waited for the lock
+            db.session.refresh(match)
+            if match.ended_at or game.winner:
+                return jsonify({'error': 'No active game'}), 400
+            
+            success, message = play_move(game, data['card'], data['row'], data['col'], current_user.username)
+            if not success:
+                return jsonify({'error': message}), 400
+            
+            save_game(match, game)
+            
+            # Scores the board if a special card filled it; a finished game is
+            # settled once, through its match, by the on_game_over hook
+            game.check_winner()
+            game_state = game.to_json()
+        
+        # Emit game state update to both players, each with their own view
+        if match.player2_id:
+            for user_id, view in player_views(match, game_state).items():
+                socketio.emit('game_state_update', view, room=str(user_id))
+        
+        return jsonify(player_view(game_state, current_user.username))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/end_turn', methods=['POST'])
+@login_required
+def end_turn():
+    # Turn state comes from the match row, not the session cookie
+    data = request.get_json(silent=True) or {}
+    match = Match.query.get(data.get('match_id'))
+    if not match or not match.game_state or match.ended_at:
+        return jsonify({'error': 'No active game'}), 400
+    
+    with match_store.game(match) as game:
+        db.session.refresh(match)
+        if not game or match.ended_at or game.winner:
+            return jsonify({'error': 'No active game'}), 400
+        if game.current_turn != current_user.username:
+            return jsonify({'error': 'Not your turn'}), 400
+        
+        # Resets the turn flags, draws a card and switches turns (playing the
+        # computer's turn in AI matches); a full board settles the match
+        game.end_turn()
+        
+        save_game(match, game)
+        game_state = game.to_json()
+    
+    if match.player2_id:
+        for user_id, view in player_views(match, game_state).items():
+            socketio.emit('game_state_update', view, room=str(user_id))
+    
+    return jsonify(player_view(game_state, current_user.username))
+
+@bp.route('/computer_turn', methods=['POST'])
+@login_required
+def computer_turn():
+    try:
+        data = request.get_json(silent=True) or {}
+        match = Match.query.get(data.get('match_id'))
+        if not match or match.player1_id != current_user.id or match.player2_id is not None:
+            return jsonify({'error': 'Match not found'}), 404
+        if not match.game_state:
+            return jsonify({'error': 'No game state found'}), 400
+        
+        with match_store.game(match) as game:
+            db.session.refresh(match)
+            if not game or match.ended_at or game.winner:
+                return jsonify({'error': 'No active game'}), 400
+            if game.current_turn != 'Computer':
+                return jsonify({'error': 'Not computer\'s turn'}), 400
+
+            # AI logic for playing cards
+            computer_player = game.player2
+        
+            # First try to play a character card first
+            if not computer_player.has_played_character:
+                placement = game.computer_placement()
+                if placement:
+                    card_to_play, row, col = placement
+                    game.play_card(card_to_play.to_json(), row, col, 'Computer')
+
+            # Then try to play an action/effect card
+            if not computer_player.has_played_special:
+                special_cards = [c for c in computer_player.hand if not isinstance(c, CharacterCard)]
+                if special_cards:
+                    card_to_play = special_cards[0]
+                    game.play_card(card_to_play.to_json(), 0, 0, 'Computer')  # Row/col don't matter for special cards
+
+            # End turn
+            game.end_turn()
+        
+            # Update game state
+            save_game(match, game)
+            game_state = game.to_json()
+        
+        return jsonify(player_view(game_state, current_user.username))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/admin/profiler', methods=['GET', 'POST'])
+@admin_required
+def admin_profiler():
+    if request.method == 'POST':
+        action = (request.get_json(silent=True) or {}).get('action')
+        if action == 'start':
+            profiler.label_handlers(current_app._get_current_object(), socketio)
+            profiler.start()
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({'error': 'Unknown action'}), 400
+
+    # Flamegraph input: curl .../admin/profiler?format=collapsed | flamegraph.pl
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify({
+        'running': profiler.running,
+        'samples': profiler.samples,
+        'idle_samples': profiler.idle_samples,
+        'interval': profiler.interval,
+        'handlers': profiler.by_handler()
+    })
+
+@bp.route('/admin/watchdog')
+@admin_required
+def admin_watchdog():
+    return jsonify({
+        'running': watchdog.running,
+        'threshold': watchdog.threshold,
+        'stalls': list(watchdog.recent_stalls)
+    })
+
+@bp.route('/api/online-players')
+def get_online_players_count():
+    return jsonify({'count': len(online_players)})
+
+@bp.route('/api/live-matches')
+def get_live_matches():
+    # Most recently played unfinished matches; abandoned ones are settled by
+    # the stale-match reaper
+    active_matches = Match.query.filter(
+        Match.ended_at.is_(None)
+    ).order_by(Match.last_move_at.desc()).limit(10).all()
+    
+    users = users_by_id([match.player1_id for match in active_matches] + [match.player2_id for match in active_matches])
+    
+    matches_data = []
+    for match in active_matches:
+        player1 = users.get(match.player1_id)
+        player2 = users.get(match.player2_id)
+        player1_name = player1.username if player1 else None
+        player2_name = player2.username if player2 else 'Computer'
+        
+        # Get current scores from game state
+        player1_score = 0
+        player2_score = 0
+        
+        if match.game_state:
+            player1_score, player2_score = load_game(match).scores()
+        
+        matches_data.append({
+            'id': match.id,
+            'player1': {
+                'name': player1_name,
+                'rating': player1.rating if player1 else None,
+                'score': player1_score
+            },
+            'player2': {
+                'name': player2_name,
+                'rating': player2.rating if player2 else None,
+                'score': player2_score
+            },
+            'started_at': match.started_at.isoformat(),
+            'can_spectate': True
+        })
+    
+    return jsonify({'matches': matches_data})
+
+@bp.route('/api/previous-matches')
+def get_previous_matches():
+    # Get completed matches from the last 24 hours
+    previous_matches = Match.query.filter(
+        Match.ended_at.isnot(None)
+    ).order_by(Match.ended_at.desc()).limit(20).all()
+    
+    users = users_by_id([match.player1_id for match in previous_matches] + [match.player2_id for match in previous_matches])
+    
+    matches_data = []
+    for match in previous_matches:
+        player1 = users.get(match.player1_id)
+        player2 = users.get(match.player2_id)
+        winner = users.get(match.winner_id)
+        
+        # Get final scores from game state
+        game_state = match.game_state
+        player1_score = 0
+        player2_score = 0
+        
+        if game_state and 'final_scores' in game_state:
+            player1_score = game_state['final_scores']['player1']['cards']
+            player2_score = game_state['final_scores']['player2']['cards']
+        
+        matches_data.append({
+            'id': match.id,
+            'player1': {
+                'name': player1.username if player1 else None,
+                'rating': player1.rating if player1 else None,
+                'score': player1_score
+            },
+            'player2': {
+                'name': player2.username if player2 else 'Computer',
+                'rating': player2.rating if player2 else None,
+                'score': player2_score
+            },
+            'winner': winner.username if winner else 'Tie',
+            'ended_at': match.ended_at.isoformat()
+        })
+    
+    return jsonify({'matches': matches_data})
+
+@bp.route('/game/<match_id>/hint')
+@login_required
+def get_hint(match_id):
+    # Against the computer: a perfect placement once the endgame is small
+    # enough to search to the end. The solver reads both hands and both
+    # decks, so between two players the hint is the best-scoring placement,
+    # which only looks at the board and the player's own hand
+    match = Match.query.get_or_404(match_id)
+    if current_user.id not in (match.player1_id, match.player2_id):
+        return jsonify({'error': 'You are not in this match'}), 403
+    if match.ended_at or not match.game_state:
+        return jsonify({'error': 'Game is not in progress'}), 400
+    
+    with match_store.game(match) as game:
+        if game.current_turn != current_user.username:
+            return jsonify({'error': 'Not your turn'}), 400
+        if match.player2_id is not None:
+            placement = best_placement(game)
+            if placement is None:
+                return jsonify({'hint': None, 'message': 'No card can be placed'})
+            card, row, col = placement
+            return jsonify({'hint': {'card': card.to_json(), 'row': row, 'col': col}})
+        move = endgame.best_move(game)
+    
+    if move is None:
+        return jsonify({
+            'hint': None,
+            'message': f'Hints are available once {endgame.max_empty} or fewer cells are empty'
+        })
+    card, row, col, margin = move
+    return jsonify({'hint': {'card': card.to_json(), 'row': row, 'col': col, 'margin': margin}})
+
+@bp.route('/game/<match_id>/state')
+@login_required
+def get_game_state(match_id):
+    match = Match.query.get_or_404(match_id)
+    with match_store.game(match) as game:
+        if game is None:
+            game = start_game(match)
+        game_state = game.to_json()
+    
+    # Hide the opponent's hand and the stats of their captured cards
+    current_player_name = game_state['player1']['name'] if current_user.id == match.player1_id else game_state['player2']['name']
+    game_state = player_view(game_state, current_player_name)
+    
+    # Ensure consistent username handling in game state
+    game_state['current_player'] = current_player_name
+    
+    return jsonify(game_state)
+
+@bp.route('/surrender', methods=['POST'])
+@login_required
+def surrender():
+    data = request.get_json(silent=True) or {}
+    match = Match.query.get(data.get('match_id'))
+    if not match or current_user.id not in (match.player1_id, match.player2_id):
+        return jsonify({'error': 'Match not found'}), 404
+    
+    if not forfeit_match(match, current_user.id):
+        return jsonify({'error': 'No active game'}), 400
+    
+    return jsonify({'success': True})
+
+@bp.route('/api/player/<username>')
+@login_required
+def get_player_profile(username):
+    player = User.query.filter_by(username=username).first_or_404()
+    
+    # Get match history
+    matches = Match.query.filter(
+        ((Match.player1_id == player.id) | (Match.player2_id == player.id)) &
+        (Match.ended_at.isnot(None))
+    ).order_by(Match.ended_at.desc()).limit(10).all()
+    
+    opponents = users_by_id(match.player2_id if match.player1_id == player.id else match.player1_id for match in matches)
+    
+    match_history = []
+    for match in matches:
+        opponent = opponents.get(match.player2_id if match.player1_id == player.id else match.player1_id)
+        result = 'won' if match.winner_id == player.id else 'lost'
+        match_history.append({
+            'opponent': opponent.username if opponent else 'Computer',
+            'result': result,
+            'date': match.ended_at.isoformat()
+        })
+    
+    return jsonify({
+        'username': player.username,
+        'rating': player.rating,
+        'rank': get_leaderboard().rank(player.id),
+        'games_played': player.games_played,
+        'games_won': player.games_won,
+        'match_history': match_history
+    })
+
+@bp.route('/api/leaderboard')
+def get_leaderboard_top():
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    board = get_leaderboard()
+    return jsonify({
+        'players': board.top(limit),
+        'total': len(board)
+    })
+
+@bp.route('/api/leaderboard/me')
+@login_required
+def get_leaderboard_position():
+    radius = min(request.args.get('radius', 5, type=int), 25)
+    board = get_leaderboard()
+    return jsonify({
+        'rank': board.rank(current_user.id),
+        'total': len(board),
+        'neighbours': board.around(current_user.id, radius)
+    })
+
+# Add route to get user's coin balance
+@bp.route('/api/coins')
+@login_required
+def get_coin_balance():
+    return jsonify({
+        'coins': current_user.smash_coins
+    })
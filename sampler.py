@@ -0,0 +1,142 @@
+"""Opt-in sampling profiler for a live server.
+
+A native thread snapshots the other threads' stacks with
+sys._current_frames() at a fixed interval. Under eventlet all greenthreads
+share the main thread, so each sample shows whichever greenthread holds the
+hub at that moment, including one stuck in PBKDF2, JSON encoding or a
+SQLite commit. Stacks are attributed to the route or socket event whose
+handler is on the stack and aggregated in the collapsed format read by
+flamegraph.pl and speedscope.
+"""
+import inspect
+import os
+import signal
+import sys
+from collections import Counter
+
+try:
+    # The sampler must stay a real OS thread even if eventlet patched threading
+    from eventlet.patcher import original
+    _threading = original('threading')
+    _time = original('time')
+except ImportError:
+    import threading as _threading
+    import time as _time
+
+# Python-level frames a thread sits in when it has nothing to do: the eventlet
+# hub polling for IO and idle native pool workers
+IDLE_FUNCTIONS = {'wait', 'get', 'poll', 'select', 'sleep', 'accept'}
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.code_labels = {}  # handler code object -> 'http:<endpoint>' or 'socket:<event>'
+        self.samples = 0
+        self.idle_samples = 0
+        self.thread = None
+        self.running = False
+        self.started_at = None
+        self.lock = _threading.Lock()
+
+    def label_handlers(self, app, socketio):
+        for endpoint, view in app.view_functions.items():
+            self.code_labels[inspect.unwrap(view).__code__] = f'http:{endpoint}'
+        for handlers in socketio.server.handlers.values():
+            for event, handler in handlers.items():
+                self.code_labels[inspect.unwrap(handler).__code__] = f'socket:{event}'
+
+    def start(self):
+        if self.running:
+            return False
+        self.running = True
+        self.started_at = _time.time()
+        self.thread = _threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self.running = False
+        self.thread.join()
+        self.thread = None
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.idle_samples = 0
+
+    def _run(self):
+        own_id = _threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(frame)
+            _time.sleep(self.interval)
+
+    def _sample(self, frame):
+        if frame.f_code.co_name in IDLE_FUNCTIONS and not self._has_handler(frame):
+            with self.lock:
+                self.idle_samples += 1
+            return
+
+        frames = []
+        label = None
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            if label is None:
+                label = self.code_labels.get(code)
+            frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        frames.append(label or 'other')
+        with self.lock:
+            self.stacks[';'.join(reversed(frames))] += 1
+            self.samples += 1
+
+    def _has_handler(self, frame):
+        while frame is not None:
+            if frame.f_code in self.code_labels:
+                return True
+            frame = frame.f_back
+        return False
+
+    def collapsed(self):
+        # One "root;...;leaf count" line per distinct stack
+        with self.lock:
+            stacks = self.stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def by_handler(self):
+        totals = Counter()
+        with self.lock:
+            for stack, count in self.stacks.items():
+                totals[stack.split(';', 1)[0]] += count
+        return dict(totals.most_common())
+
+    def dump(self, directory='.'):
+        path = os.path.join(directory, f'profile-{os.getpid()}-{int(_time.time())}.folded')
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+        return path
+
+
+def install_signal_handler(profiler, directory='.', signum=getattr(signal, 'SIGUSR2', None)):
+    """Toggle the profiler with a signal (SIGUSR2 by default); stopping writes
+    the collapsed stacks to `directory`."""
+    if signum is None:
+        return
+
+    def toggle(signum, frame):
+        if profiler.start():
+            print(f"Sampling profiler started (pid {os.getpid()})")
+        else:
+            profiler.stop()
+            print(f"Sampling profiler stopped, {profiler.samples} samples written to {profiler.dump(directory)}")
+            profiler.reset()
+
+    signal.signal(signum, toggle)
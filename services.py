@@ -0,0 +1,682 @@
+"""State and helpers shared by the routes, socket handlers and background jobs."""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, inspect, or_
+from sqlalchemy.orm import make_transient_to_detached
+
+from ai import best_placement
+from engine import Game
+from extensions import db, login_manager, metrics, socketio
+from leaderboard import Leaderboard
+from ledger import CoinLedger
+from matches import MatchStore
+from models import User, Match, CoinTransaction, LeaderboardEntry, Friend
+from rating import get_k_factor, calculate_rating_change, SURRENDER_RATING_CHANGE
+from resume import MatchEventLog, ResumeRegistry
+from solver import EndgameSolver
+from timers import TimingWheel
+from user_cache import UserCache
+
+# Online players tracking
+online_players = set()
+
+active_chats = defaultdict(set)  # Track active chat sessions
+
+# Dropped sockets keep their rooms and chats for a grace period, and game
+# clients catch up from recent state deltas (see resume.py)
+resumes = ResumeRegistry(grace=30)
+match_events = MatchEventLog()
+RESUME_EXPIRY_INTERVAL = 5  # seconds
+
+def notify_friends_status_change(user_id, status):
+    # Get user's friends
+    friends = Friend.query.filter(
+        ((Friend.user_id == user_id) | (Friend.friend_id == user_id)) &
+        (Friend.status == 'accepted')
+    ).all()
+    
+    user = User.query.get(user_id)
+    if not user:
+        return
+    
+    # Notify each friend
+    for friend in friends:
+        friend_id = friend.friend_id if friend.user_id == user_id else friend.user_id
+        socketio.emit('friend_status_change', {
+            'username': user.username,
+            'status': status
+        }, room=str(friend_id))
+
+def expire_disconnected():
+    # Users whose dropped connections weren't resumed in time go offline
+    for user_id in set(resumes.expire()):
+        if resumes.connected(user_id):
+            continue
+        online_players.discard(user_id)
+        active_chats.pop(user_id, None)
+        try:
+            notify_friends_status_change(user_id, 'offline')
+        except Exception as e:
+            db.session.rollback()
+            metrics.errors.inc('expire_disconnected')
+            print(f"Error notifying friends of user {user_id}: {str(e)}")
+
+# Identity cache so current_user doesn't cost a query per request and socket event
+user_cache = UserCache(maxsize=4096, ttl=60)
+USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+@login_manager.user_loader
+def load_user(id):
+    user_id = int(id)
+    values = user_cache.get(user_id)
+    if values is None:
+        user = User.query.get(user_id)
+        if user:
+            user_cache.put(user_id, {key: getattr(user, key) for key in USER_COLUMNS})
+        return user
+
+    # Rebuild the row and attach it to the session without a SELECT
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+def users_by_id(user_ids):
+    # One query for a page of users instead of a lookup per row
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    return {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+
+# Matchmaking system
+MATCHMAKING_HEARTBEAT_TIMEOUT = 30  # seconds a searching client may go without a heartbeat
+MATCHMAKING_EXPIRY_INTERVAL = 10  # seconds
+
+class MatchmakingQueue:
+    # One entry per user, in the order they started searching, so a repeated
+    # find_match, a cancel or a disconnect is a dict operation
+    def __init__(self):
+        self.queue = {}  # user id -> {'id', 'sid', 'rating', 'time', 'seen'}
+        self.matches = {}
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add_player(self, player_id, rating, sid=None):
+        # Searching again from another tab moves the entry to that socket
+        # but keeps the player's place in the queue
+        now = datetime.utcnow()
+        player = self.queue.get(player_id)
+        if player is None:
+            player = self.queue[player_id] = {'id': player_id, 'time': now}
+        player.update(sid=sid, rating=rating, seen=now)
+
+    def heartbeat(self, player_id):
+        # Returns False if the player is no longer queued
+        player = self.queue.get(player_id)
+        if player is None:
+            return False
+        player['seen'] = datetime.utcnow()
+        return True
+
+    def remove_player(self, player_id, sid=None):
+        # With a sid, only if the player is searching from that socket
+        player = self.queue.get(player_id)
+        if player is None or (sid is not None and player['sid'] != sid):
+            return False
+        del self.queue[player_id]
+        return True
+
+    def expire(self):
+        # Drop players whose client stopped sending heartbeats; returns their ids
+        cutoff = datetime.utcnow() - timedelta(seconds=MATCHMAKING_HEARTBEAT_TIMEOUT)
+        expired = [player_id for player_id, player in self.queue.items() if player['seen'] < cutoff]
+        for player_id in expired:
+            del self.queue[player_id]
+        return expired
+
+    def find_match(self):
+        if len(self.queue) < 2:
+            return None
+        
+        players = sorted(self.queue.values(), key=lambda x: (x['rating'], x['time']))
+        
+        for i, player1 in enumerate(players):
+            for player2 in players[i+1:]:
+                if abs(player1['rating'] - player2['rating']) <= 200:
+                    # Take both out before the commit yields, so a concurrent
+                    # search can't pair either of them again
+                    del self.queue[player1['id']]
+                    del self.queue[player2['id']]
+                    
+                    try:
+                        match = Match(
+                            player1_id=player1['id'],
+                            player2_id=player2['id'],
+                            started_at=datetime.utcnow()
+                        )
+                        db.session.add(match)
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        self.queue.setdefault(player1['id'], player1)
+                        self.queue.setdefault(player2['id'], player2)
+                        raise
+                    
+                    self.matches[match.id] = {
+                        'player1': player1['id'],
+                        'player2': player2['id']
+                    }
+                    
+                    return match.id
+        
+        return None
+
+matchmaking = MatchmakingQueue()
+
+def expire_matchmaking():
+    for player_id in matchmaking.expire():
+        socketio.emit('matchmaking_cancelled', {'reason': 'timeout'}, room=str(player_id))
+
+# Ranking index, updated whenever a rating changes
+leaderboard = Leaderboard()
+LEADERBOARD_SNAPSHOT_INTERVAL = 60  # seconds
+LEADERBOARD_SNAPSHOT_BATCH = 500  # rows written per transaction
+
+def get_leaderboard():
+    if not leaderboard.loaded:
+        leaderboard.load(db.session.query(User.id, User.username, User.rating).all())
+    return leaderboard
+
+def sync_leaderboard(*users):
+    # Until the first read builds the index there is nothing to keep in sync
+    if not leaderboard.loaded:
+        return
+    for user in users:
+        if user:
+            leaderboard.update(user.id, user.username, user.rating)
+
+def snapshot_leaderboard():
+    # Only ranks whose row changed are written, a batch per transaction, so
+    # the SQLite write lock is never held for the whole table while match
+    # results and ledger writes wait. Between batches readers may see a
+    # player at both their old and new rank
+    entries = get_leaderboard().snapshot()
+    if entries is None:
+        return
+    try:
+        saved = {rank: (user_id, username, rating) for rank, user_id, username, rating in db.session.query(
+            LeaderboardEntry.rank, LeaderboardEntry.user_id, LeaderboardEntry.username, LeaderboardEntry.rating)}
+        db.session.commit()
+        now = datetime.utcnow()
+        changed = [{
+            'rank': entry['rank'],
+            'user_id': entry['user_id'],
+            'username': entry['username'],
+            'rating': entry['rating'],
+            'snapshot_at': now
+        } for entry in entries if saved.get(entry['rank']) != (entry['user_id'], entry['username'], entry['rating'])]
+        updates = [row for row in changed if row['rank'] in saved]
+        inserts = [row for row in changed if row['rank'] not in saved]
+        for i in range(0, len(updates), LEADERBOARD_SNAPSHOT_BATCH):
+            db.session.bulk_update_mappings(LeaderboardEntry, updates[i:i + LEADERBOARD_SNAPSHOT_BATCH])
+            db.session.commit()
+        for i in range(0, len(inserts), LEADERBOARD_SNAPSHOT_BATCH):
+            db.session.bulk_insert_mappings(LeaderboardEntry, inserts[i:i + LEADERBOARD_SNAPSHOT_BATCH])
+            db.session.commit()
+        if len(saved) > len(entries):
+            LeaderboardEntry.query.filter(LeaderboardEntry.rank > len(entries)).delete(synchronize_session=False)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        leaderboard.changed = True  # Retry on the next run
+        metrics.errors.inc('snapshot_leaderboard')
+        print(f"Error snapshotting leaderboard: {str(e)}")
+
+# SmashCoins ledger
+ledger = CoinLedger(db, User, CoinTransaction, on_change=user_cache.invalidate)
+LEDGER_RECONCILE_INTERVAL = 600  # seconds
+
+def reconcile_coin_ledger():
+    try:
+        for user_id, balance, ledger_total in ledger.reconcile():
+            print(f"Coin ledger mismatch for user {user_id}: balance {balance}, ledger total {ledger_total}")
+    except Exception as e:
+        db.session.rollback()
+        metrics.errors.inc('reconcile_coin_ledger')
+        print(f"Error reconciling coin ledger: {str(e)}")
+
+def run_periodic(app, job, interval):
+    # Background loop for maintenance jobs, started with socketio.start_background_task
+    while True:
+        socketio.sleep(interval)
+        with app.app_context():
+            job()
+
+def bet_payout(match):
+    total_bet = match.bet_amount * 2  # Both players bet the same amount
+    system_cut = int(total_bet * 0.3)  # 30% to system
+    return total_bet - system_cut  # Remaining to winner
+
+def match_rewards(match, winner_id):
+    """SmashCoins owed after a match: {user_id: [(amount, reason)]}"""
+    rewards = defaultdict(list)
+
+    if match.player2_id is None:  # AI match
+        if winner_id and winner_id == match.player1_id:  # Player won against AI
+            ai_reward = 10  # Reward for beating AI
+            rewards[winner_id].append((ai_reward, 'You won against the computer!'))
+    elif winner_id:  # PvP match
+        loser_id = match.player2_id if winner_id == match.player1_id else match.player1_id
+
+        if match.bet_amount > 0:
+            rewards[winner_id].append((bet_payout(match), 'You won the bet!'))
+
+        # Default win reward even without betting
+        base_reward = 5
+        rewards[winner_id].append((base_reward, 'Base reward for winning'))
+
+        # Small consolation prize for loser
+        consolation = 2
+        rewards[loser_id].append((consolation, 'Consolation prize'))
+
+    return rewards
+
+def update_player_ratings(match, winner_id):
+    # Only multiplayer games are rated. Changes are left in the session for
+    # the caller to commit; returns the players to resync on the leaderboard
+    if match.player2_id is None:
+        return ()
+    player1 = User.query.get(match.player1_id)
+    player2 = User.query.get(match.player2_id)
+    if not player1 or not player2:
+        return ()
+        
+    # Calculate base K-factor based on games played
+    k_factor1 = get_k_factor(player1.games_played)
+    k_factor2 = get_k_factor(player2.games_played)
+    k_factor = min(k_factor1, k_factor2)  # Use the lower K-factor
+    
+    # Calculate rating changes based on outcome
+    if winner_id == player1.id:
+        rating_change = calculate_rating_change(player1.rating, player2.rating, k_factor)
+        player1.rating += rating_change
+        player2.rating -= rating_change
+        player1.games_won += 1
+    elif winner_id == player2.id:
+        rating_change = calculate_rating_change(player2.rating, player1.rating, k_factor)
+        player2.rating += rating_change
+        player1.rating -= rating_change
+        player2.games_won += 1
+    
+    # Update games played
+    player1.games_played += 1
+    player2.games_played += 1
+    
+    # Ensure ratings don't go below 1
+    player1.rating = max(1, player1.rating)
+    player2.rating = max(1, player2.rating)
+    return player1, player2
+
+def complete_match(game):
+    """on_game_over hook: settle a finished game through its match row.
+
+    The conditional UPDATE on ended_at claims the match, so however many
+    times a result is reported only the first settles it. The result,
+    ratings and rewards commit together.
+    """
+    if game.match_id is None:
+        return
+    # A finished game takes no more moves; if settling fails, the reloaded
+    # game reports its result again
+    match_store.discard(game.match_id)
+    try:
+        match = Match.query.get(game.match_id)
+        if match is None:
+            return
+        winner_id = {game.player1.name: match.player1_id, game.player2.name: match.player2_id}.get(game.winner)
+        game.version += 1
+        claimed = Match.query.filter(Match.id == match.id, Match.ended_at.is_(None)).update({
+            Match.ended_at: datetime.utcnow(),
+            Match.winner_id: winner_id,
+            Match.game_state: game.to_state()
+        }, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return
+        cancel_turn_timer(match.id)
+
+        players = update_player_ratings(match, winner_id)
+        rewards = match_rewards(match, winner_id)
+        for user_id, items in rewards.items():
+            for amount, reason in items:
+                ledger.credit(user_id, amount, reason, match.id)
+        db.session.commit()
+        match_events.record(match.id, game.to_json())
+    except Exception as e:
+        db.session.rollback()
+        metrics.errors.inc('complete_match')
+        print(f"Error completing match {game.match_id}: {str(e)}")
+        return
+
+    sync_leaderboard(*players)
+
+    # One combined coins notification per user
+    balances = ledger.balances(list(rewards))
+    for user_id, items in rewards.items():
+        socketio.emit('coins_update', {
+            'coins': balances.get(user_id),
+            'earned': sum(amount for amount, _ in items),
+            'reason': ' + '.join(reason for _, reason in items)
+        }, room=str(user_id))
+
+# Exact late-game search, shared by the computer and hints
+endgame = EndgameSolver()
+
+def computer_move(game):
+    # Perfect play once few enough cells are empty to search to the end,
+    # the best-scoring placement before that
+    move = endgame.best_move(game)
+    if move:
+        return move[:3]
+    return best_placement(game)
+
+def load_game(match):
+    # Rebuild a match's game, bound to the row and settled through it.
+    # Rows saved before games were seeded hold the full to_json() form
+    if 'seed' in match.game_state:
+        game = Game.from_state(match.game_state, on_game_over=complete_match)
+    else:
+        game = Game.from_json(match.game_state, on_game_over=complete_match)
+    if game:
+        game.match_id = match.id
+        game.computer_policy = computer_move
+    return game
+
+def load_saved_game(match):
+    # Re-read the row under the match lock: another request may have saved
+    # moves since this one loaded it
+    db.session.refresh(match)
+    return load_game(match) if match.game_state else None
+
+# One resident game per active match; all changes go through match_store.game()
+match_store = MatchStore(load_saved_game)
+
+def save_game(match, game):
+    # Every saved change gets the next state version
+    game.version += 1
+    match.game_state = game.to_state()
+    match.last_move_at = datetime.utcnow()
+    db.session.commit()
+    match_events.record(match.id, game.to_json())
+    if not game.winner:
+        arm_turn_timer(match.id, game.version)
+
+# What a player is shown of a game: their opponent's hand as card backs and
+# the stats of their opponent's captured cards hidden. Spectators (viewer
+# None) see neither hand
+def hidden_card():
+    return {'type': 'CardBack', 'name': 'Hidden Card'}
+
+def board_card_view(card, viewer):
+    if card and card['is_captured'] and card['owner'] != viewer and card['type'] == 'CharacterCard':
+        return {
+            'type': card['type'],
+            'name': card['name'],
+            'is_captured': True,
+            'owner': card['owner'],
+            'faction': card.get('faction', ''),
+            'elements': {'Fire': '?', 'Water': '?', 'Air': '?', 'Earth': '?'}
+        }
+    return card
+
+def player_view(state, viewer):
+    """A to_json() state as the player named `viewer` may see it. The state
+    itself is left as it is: it is shared by every recipient."""
+    view = dict(state)
+    for key in ('player1', 'player2'):
+        if state[key]['name'] != viewer:
+            view[key] = dict(state[key], hand=[hidden_card() for _ in state[key]['hand']])
+    view['grid'] = [[board_card_view(card, viewer) for card in row] for row in state['grid']]
+    return view
+
+def player_views(match, state):
+    # Each human player's view of `state`, by user id
+    return {user_id: player_view(state, state[key]['name'])
+            for user_id, key in ((match.player1_id, 'player1'), (match.player2_id, 'player2')) if user_id}
+
+def emit_to_players(match, event, payload):
+    # A game_state_update payload goes out as each player's own view
+    views = player_views(match, payload) if event == 'game_state_update' else None
+    for user_id in (match.player1_id, match.player2_id):
+        if user_id:
+            socketio.emit(event, views[user_id] if views else payload, room=str(user_id))
+
+def delta_view(delta, viewer_key, viewer):
+    # A match_events delta as the player `viewer`, seated as viewer_key
+    # ('player1' or 'player2'), may see it: cards the opponent draws arrive
+    # as card backs
+    view = dict(delta, cells=[[row, col, board_card_view(card, viewer)] for row, col, card in delta['cells']])
+    view['hands'] = {key: hand if key == viewer_key else {'keep': hand['keep'], 'add': [hidden_card() for _ in hand['add']]}
+                     for key, hand in delta['hands'].items()}
+    return view
+
+def play_move(game, card, row, col, player_name):
+    success, message = game.play_card(card, row, col, player_name)
+    # Automatically end the turn if a character card was played
+    if success and card.get('type') == 'CharacterCard':
+        game.end_turn()
+    return success, message
+
+def start_game(match):
+    # Call inside match_store.game(match) when it yields None
+    player1 = User.query.get(match.player1_id)
+    player2 = User.query.get(match.player2_id) if match.player2_id else None
+    game = Game(player1.username, player2.username if player2 else 'Computer', match.id, on_game_over=complete_match)
+    game.computer_policy = computer_move
+    match.game_state = game.to_state()
+    match.last_move_at = datetime.utcnow()
+    db.session.commit()
+    match_store.keep(match.id, game)
+    match_events.record(match.id, game.to_json())
+    arm_turn_timer(match.id, game.version)
+    return game
+
+def forfeit_match(match, loser_id):
+    """End a match as lost by `loser_id`, on surrender or after too many
+    turn timeouts. Returns False if the match had already ended."""
+    # Claim the match so a forfeit can't also be settled as a normal finish
+    winner_id = match.player2_id if match.player1_id == loser_id else match.player1_id
+    claimed = Match.query.filter(Match.id == match.id, Match.ended_at.is_(None)).update(
+        {'ended_at': datetime.utcnow(), 'winner_id': winner_id},
+        synchronize_session=False
+    )
+    if not claimed:
+        db.session.rollback()
+        return False
+    
+    # Update player stats
+    loser = User.query.get(loser_id)
+    loser.games_played += 1
+    winner = User.query.get(winner_id) if winner_id else None
+    if winner:
+        winner.games_played += 1
+        winner.games_won += 1
+        
+        # Update ratings
+        rating_change = SURRENDER_RATING_CHANGE
+        loser.rating = max(1, loser.rating - rating_change)
+        winner.rating += rating_change
+
+        # The bet is still paid out, so staked coins don't vanish with the match
+        if match.bet_amount > 0:
+            ledger.credit(winner.id, bet_payout(match), 'You won the bet!', match.id)
+    
+    db.session.commit()
+    match_store.discard(match.id)
+    cancel_turn_timer(match.id)
+    sync_leaderboard(loser, winner)
+    if winner and match.bet_amount > 0:
+        socketio.emit('coins_update', {
+            'coins': ledger.balances([winner.id]).get(winner.id),
+            'earned': bet_payout(match),
+            'reason': 'You won the bet!'
+        }, room=str(winner.id))
+    return True
+
+# Turn clocks. Every clock lives in one timing wheel advanced by a single
+# greenthread; a move re-arms its match's clock in O(1)
+TURN_TIMEOUT = 60  # seconds a player has to move before their turn is passed
+MAX_MISSED_TURNS = 2  # turns a player may time out on in a match before forfeiting
+turn_wheel = TimingWheel(tick=0.5)
+turn_timers = {}  # match id -> Timer for the current turn
+missed_turns = defaultdict(lambda: defaultdict(int))  # match id -> {player name: timeouts}
+
+def arm_turn_timer(match_id, version):
+    cancel_turn_timer(match_id, finished=False)
+    turn_timers[match_id] = turn_wheel.schedule(TURN_TIMEOUT, turn_timed_out, match_id, version)
+
+def cancel_turn_timer(match_id, finished=True):
+    timer = turn_timers.pop(match_id, None)
+    if timer:
+        turn_wheel.cancel(timer)
+    if finished:
+        missed_turns.pop(match_id, None)
+
+def run_turn_timers(app):
+    while True:
+        socketio.sleep(turn_wheel.tick)
+        with app.app_context():
+            turn_wheel.advance()
+
+def turn_timed_out(match_id, version):
+    turn_timers.pop(match_id, None)
+    try:
+        match = Match.query.get(match_id)
+        if match is None or match.ended_at:
+            return
+        with match_store.game(match) as game:
+            # A move since the clock was armed means this timeout is stale
+            if game is None or game.winner or game.version != version:
+                return
+            player_name = game.current_turn
+            missed_turns[match_id][player_name] += 1
+            if missed_turns[match_id][player_name] >= MAX_MISSED_TURNS:
+                loser_id = match.player1_id if player_name == game.player1.name else match.player2_id
+                winner_name = game.player2.name if player_name == game.player1.name else game.player1.name
+                if not forfeit_match(match, loser_id):
+                    return
+                event, payload = 'game_over', {
+                    'winner': winner_name,
+                    'message': f'{player_name} ran out of time and forfeits'
+                }
+            else:
+                # Pass the turn; a full board settles the match as usual
+                game.end_turn()
+                save_game(match, game)
+                game.check_winner()
+                event, payload = 'game_state_update', game.to_json()
+        emit_to_players(match, event, payload)
+    except Exception as e:
+        db.session.rollback()
+        metrics.errors.inc('turn_timed_out')
+        print(f"Error timing out turn in match {match_id}: {str(e)}")
+
+# Stale-match reaper. Players who leave without finishing keep their match
+# open forever; every few minutes the oldest untouched ones are settled a
+# batch at a time, each in its own short transaction so the SQLite write
+# lock is never held across a batch
+STALE_MATCH_AFTER = 600  # seconds without a move before an open match is abandoned
+REAP_INTERVAL = 120  # seconds
+REAP_BATCH = 50  # matches read per query
+
+def reap_stale_matches(batch=REAP_BATCH):
+    """Settle open matches with no move for STALE_MATCH_AFTER seconds and
+    evict the resident state of ended matches. Returns how many matches
+    were settled."""
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_MATCH_AFTER)
+    reaped = 0
+    after = None  # (last_move_at, id) of the last match looked at
+    while True:
+        query = db.session.query(Match.id, Match.last_move_at).filter(
+            Match.ended_at.is_(None), Match.last_move_at < cutoff)
+        if after:
+            query = query.filter(or_(Match.last_move_at > after[0],
+                                     and_(Match.last_move_at == after[0], Match.id > after[1])))
+        rows = query.order_by(Match.last_move_at, Match.id).limit(batch).all()
+        db.session.commit()
+        for match_id, last_move_at in rows:
+            try:
+                if reap_match(match_id, cutoff):
+                    reaped += 1
+            except Exception as e:
+                db.session.rollback()
+                metrics.errors.inc('reap_stale_matches')
+                print(f"Error reaping match {match_id}: {str(e)}")
+            # Let moves on other matches in between
+            socketio.sleep(0)
+        if len(rows) < batch:
+            break
+        after = rows[-1]
+
+    # Games and acks of matches that have ended elsewhere
+    resident = match_store.resident()
+    for start in range(0, len(resident), batch):
+        ended = db.session.query(Match.id).filter(
+            Match.id.in_(resident[start:start + batch]), Match.ended_at.isnot(None)).all()
+        for match_id, in ended:
+            match_store.forget(match_id)
+            match_events.discard(match_id)
+    db.session.commit()
+    return reaped
+
+def reap_match(match_id, cutoff):
+    # Settle one abandoned match under its lock; False if it moved or ended meanwhile
+    match = Match.query.get(match_id)
+    if match is None:
+        return False
+    with match_store.game(match) as game:
+        db.session.refresh(match)
+        if match.ended_at or match.last_move_at >= cutoff:
+            return False
+        if game is None:
+            # Never dealt: nothing to score or pay out
+            claimed = Match.query.filter(Match.id == match.id, Match.ended_at.is_(None)).update(
+                {'ended_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            settled = bool(claimed)
+            event, payload = None, None
+        elif game.winner or all(card for row in game.grid for card in row):
+            # Left on a full board: score it as a normal finish
+            if game.winner:
+                complete_match(game)
+            else:
+                game.check_winner()
+            db.session.refresh(match)
+            settled = match.ended_at is not None
+            event, payload = 'game_state_update', game.to_json()
+        else:
+            # Whoever the game is waiting on abandoned it; against the
+            # computer that is always the player
+            if match.player2_id is None or game.current_turn == game.player1.name:
+                loser_id, loser_name = match.player1_id, game.player1.name
+            else:
+                loser_id, loser_name = match.player2_id, game.player2.name
+            winner_name = game.player2.name if loser_id == match.player1_id else game.player1.name
+            settled = forfeit_match(match, loser_id)
+            event, payload = 'game_over', {
+                'winner': winner_name,
+                'message': f'{loser_name} abandoned the match'
+            }
+    match_store.forget(match.id)
+    match_events.discard(match.id)
+    cancel_turn_timer(match.id)
+    if settled and event:
+        emit_to_players(match, event, payload)
+    return settled
+
@@ -0,0 +1,190 @@
+"""Server-side sessions.
+
+Flask's default session serializes everything into a signed cookie that
+rides on every request and is re-signed on every change. Here the cookie
+only carries a signed random session id; the data lives in an in-memory LRU
+keyed by that id, optionally written through to a SQLite file so sessions
+survive a restart or eviction from the LRU. Sessions nobody is logged in to
+(a visit to /login leaves one holding a CSRF token) get a smaller LRU of
+their own, so crawler traffic can't evict signed-in users.
+"""
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+SESSION_PURGE_INTERVAL = 3600  # seconds
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None
+
+    def regenerate(self):
+        # New id for the same data, so an id planted before login is useless
+        if self.replaced_sid is None and not self.new:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SessionStore:
+    """LRU of serialized sessions with an expiry time each, plus a separate
+    LRU for anonymous ones. With `path` set, writes go through to SQLite and
+    LRU misses are read back from it."""
+
+    def __init__(self, maxsize=10000, path=None, anonymous_maxsize=1000):
+        self.maxsize = maxsize
+        self.anonymous_maxsize = anonymous_maxsize
+        self.entries = OrderedDict()  # sid -> (expires_at, serialized data)
+        self.anonymous = OrderedDict()  # the same, for sessions nobody is logged in to
+        self.lock = Lock()
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS sessions '
+                '(sid TEXT PRIMARY KEY, expires_at REAL NOT NULL, data TEXT NOT NULL)')
+
+    def get(self, sid):
+        with self.lock:
+            entries = self.entries if sid in self.entries else self.anonymous
+            entry = entries.get(sid)
+            if entry is None and self.connection is not None:
+                entry = self.connection.execute(
+                    'SELECT expires_at, data FROM sessions WHERE sid = ?', (sid,)).fetchone()
+                if entry is not None:
+                    self._remember(sid, tuple(entry))
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._forget(sid)
+                return None
+            if sid in entries:
+                entries.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, data, expires_at, anonymous=False):
+        with self.lock:
+            self._remember(sid, (expires_at, data), anonymous)
+            if self.connection is not None:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO sessions (sid, expires_at, data) VALUES (?, ?, ?)',
+                    (sid, expires_at, data))
+
+    def delete(self, sid):
+        with self.lock:
+            self._forget(sid)
+
+    def purge(self):
+        # Drop expired sessions; returns how many were removed from memory
+        now = time.time()
+        with self.lock:
+            expired = [sid for sid, (expires_at, _) in self.entries.items() if expires_at < now]
+            for sid in expired:
+                del self.entries[sid]
+            anonymous = [sid for sid, (expires_at, _) in self.anonymous.items() if expires_at < now]
+            for sid in anonymous:
+                del self.anonymous[sid]
+            expired += anonymous
+            if self.connection is not None:
+                self.connection.execute('DELETE FROM sessions WHERE expires_at < ?', (now,))
+        return len(expired)
+
+    def _remember(self, sid, entry, anonymous=False):
+        entries, maxsize = (self.anonymous, self.anonymous_maxsize) if anonymous else (self.entries, self.maxsize)
+        (self.entries if anonymous else self.anonymous).pop(sid, None)
+        entries[sid] = entry
+        entries.move_to_end(sid)
+        while len(entries) > maxsize:
+            entries.popitem(last=False)
+
+    def _forget(self, sid):
+        self.entries.pop(sid, None)
+        self.anonymous.pop(sid, None)
+        if self.connection is not None:
+            self.connection.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+def regenerate_session():
+    # Call on login and logout
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def signer(self, app):
+        return Signer(app.secret_key, salt='smash-session', key_derivation='hmac')
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self.signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.get(sid) if sid else None
+            if data is not None:
+                try:
+                    return ServerSession(self.serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+
+        if not session:
+            # Emptied (e.g. logout): forget it server-side and drop the cookie
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        # Browser-session cookies still expire server-side after the same lifetime
+        expires = self.get_expiration_time(app, session)
+        expires_at = time.time() + app.permanent_session_lifetime.total_seconds()
+        # Flask-Login keeps the signed-in user under _user_id
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), expires_at,
+                       anonymous='_user_id' not in session)
+        response.set_cookie(
+            name,
+            self.signer(app).sign(session.sid).decode(),
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
@@ -0,0 +1,501 @@
+from flask_login import current_user
+from flask import request
+from flask_socketio import emit, join_room, leave_room, rooms
+from datetime import datetime
+from extensions import db, socketio
+from models import User, Match, ChatMessage, Friend
+from services import online_players, active_chats, matchmaking, ledger, match_store, save_game, play_move, \
+    match_events, resumes, notify_friends_status_change, player_view, player_views, delta_view
+
+# WebSocket events for matchmaking
+@socketio.on('find_match')
+def handle_find_match():
+    try:
+        if not current_user.is_authenticated:
+            emit('game_error', {'message': 'You must be logged in to find a match'})
+            return
+            
+        matchmaking.add_player(current_user.id, current_user.rating, request.sid)
+        match_id = matchmaking.find_match()
+        
+        if match_id:
+            match = Match.query.get(match_id)
+            player1 = User.query.get(match.player1_id)
+            player2 = User.query.get(match.player2_id)
+            
+            emit('match_found', {
+                'match_id': match_id,
+                'opponent': player2.username
+            }, room=str(player1.id))
+            
+            emit('match_found', {
+                'match_id': match_id,
+                'opponent': player1.username
+            }, room=str(player2.id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('matchmaking_heartbeat')
+def handle_matchmaking_heartbeat():
+    # Sent every few seconds while searching; acked with whether the player
+    # is still queued, so a client that lost its place can search again
+    if not current_user.is_authenticated:
+        return {'queued': False}
+    return {'queued': matchmaking.heartbeat(current_user.id)}
+
+@socketio.on('cancel_matchmaking')
+def handle_cancel_matchmaking():
+    if current_user.is_authenticated:
+        matchmaking.remove_player(current_user.id)
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    if current_user.is_authenticated:
+        # A reconnect presenting its resume token takes back the rooms of the
+        # dropped connection; its user never went offline for their friends
+        token = (auth or {}).get('resume_token')
+        previous = resumes.resume(token, current_user.id, request.sid) if token else None
+        if previous is None:
+            token = resumes.issue(current_user.id, request.sid)
+        was_online = current_user.id in online_players
+        
+        online_players.add(current_user.id)
+        join_room(str(current_user.id))
+        if previous:
+            # The old connection may not have been noticed as dropped yet
+            for room in previous['rooms'] if previous['suspended'] else rooms(sid=previous['sid']):
+                if room != previous['sid']:
+                    join_room(room)
+        emit('connection_success', {
+            'message': 'Connected successfully',
+            'resume_token': token,
+            'resumed': previous is not None
+        })
+        
+        # Notify friends that user is online
+        if not was_online:
+            notify_friends_status_change(current_user.id, 'online')
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    if current_user.is_authenticated:
+        # Chats and rooms are kept for the resume grace period; the user goes
+        # offline when it ends without a reconnect (services.expire_disconnected)
+        resumes.suspend(request.sid, [room for room in rooms() if room != request.sid])
+        # A search ends with the socket it was started from
+        matchmaking.remove_player(current_user.id, request.sid)
+
+@socketio.on('resume_match')
+def handle_resume_match(data):
+    """Catch a reconnected game client up: {match_id, version} is acked with
+    the deltas since that version, or the full state if they are no longer
+    buffered, or nothing new."""
+    if not current_user.is_authenticated:
+        return {'mode': 'error', 'error': 'You must be logged in'}
+    match_id = data.get('match_id')
+    match = Match.query.get(match_id) if match_id else None
+    if not match or current_user.id not in (match.player1_id, match.player2_id):
+        return {'mode': 'error', 'error': 'Match not found'}
+    
+    deltas = match_events.since(match.id, data.get('version'))
+    if deltas == []:
+        return {'mode': 'current'}
+    with match_store.game(match) as game:
+        if not game:
+            return {'mode': 'full', 'state': None}
+        viewer_key = 'player1' if current_user.id == match.player1_id else 'player2'
+        viewer = game.player1.name if viewer_key == 'player1' else game.player2.name
+        if deltas:
+            return {'mode': 'delta', 'deltas': [delta_view(delta, viewer_key, viewer) for delta in deltas]}
+        return {'mode': 'full', 'state': player_view(game.to_json(), viewer)}
+
+@socketio.on('private_message')
+def handle_private_message(data):
+    if not current_user.is_authenticated:
+        return
+    
+    to_user = User.query.filter_by(username=data['to']).first()
+    if not to_user:
+        emit('chat_error', {'message': 'User not found'})
+        return
+    
+    # Check if they are friends
+    friendship = Friend.query.filter(
+        ((Friend.user_id == current_user.id) & (Friend.friend_id == to_user.id)) |
+        ((Friend.user_id == to_user.id) & (Friend.friend_id == current_user.id)),
+        Friend.status == 'accepted'
+    ).first()
+    
+    if not friendship:
+        emit('chat_error', {'message': 'You must be friends to send messages'})
+        return
+    
+    # Create and save message
+    message = ChatMessage(
+        sender_id=current_user.id,
+        receiver_id=to_user.id,
+        message=data['message'],
+        is_read=str(to_user.id) in active_chats.get(current_user.id, set())
+    )
+    db.session.add(message)
+    db.session.commit()
+    
+    # Send to recipient
+    emit('private_message', {
+        'from': current_user.username,
+        'message': data['message'],
+        'timestamp': message.timestamp.isoformat(),
+        'is_read': message.is_read
+    }, room=str(to_user.id))
+
+@socketio.on('chat_opened')
+def handle_chat_opened(data):
+    if not current_user.is_authenticated:
+        return
+        
+    other_user = User.query.filter_by(username=data['with']).first()
+    if not other_user:
+        return
+        
+    # Add to active chats
+    active_chats[current_user.id].add(str(other_user.id))
+    
+    # Mark messages as read
+    unread_messages = ChatMessage.query.filter_by(
+        receiver_id=current_user.id,
+        sender_id=other_user.id,
+        is_read=False
+    ).all()
+    
+    for msg in unread_messages:
+        msg.is_read = True
+    
+    db.session.commit()
+    
+    # Notify sender that messages were read
+    emit('messages_read', {
+        'by': current_user.username
+    }, room=str(other_user.id))
+
+@socketio.on('chat_closed')
+def handle_chat_closed(data):
+    if not current_user.is_authenticated:
+        return
+        
+    other_user = User.query.filter_by(username=data['with']).first()
+    if not other_user:
+        return
+        
+    # Remove from active chats
+    active_chats[current_user.id].discard(str(other_user.id))
+
+@socketio.on('join_as_spectator')
+def handle_spectator_join(data):
+    match_id = data.get('match_id')
+    if not match_id:
+        return
+        
+    match = Match.query.get(match_id)
+    if not match:
+        return
+        
+    # Join spectator room for this match
+    join_room(f'match_{match_id}_spectators')
+    
+    # Send current game state to spectator
+    with match_store.game(match) as game:
+        game_state = player_view(game.to_json(), None) if game else None
+    emit('game_state_update', game_state)
+
+@socketio.on('leave_as_spectator')
+def handle_spectator_leave(data):
+    match_id = data.get('match_id')
+    if match_id:
+        leave_room(f'match_{match_id}_spectators')
+
+@socketio.on('game_message')
+def handle_game_message(data):
+    if not current_user.is_authenticated:
+        return
+    
+    match = Match.query.get(data['match_id'])
+    if not match:
+        return
+    
+    # Create chat message
+    message = ChatMessage(
+        match_id=match.id,
+        sender_id=current_user.id,
+        message=data['message']
+    )
+    db.session.add(message)
+    db.session.commit()
+    
+    # Send to all players in the match
+    for player_id in [match.player1_id, match.player2_id]:
+        if player_id and player_id != current_user.id:
+            socketio.emit('game_message', {
+                'from': current_user.username,
+                'message': data['message'],
+                'timestamp': message.timestamp.isoformat()
+            }, room=str(player_id))
+
+@socketio.on('card_played')
+def handle_card_played(data):
+    try:
+        if not current_user.is_authenticated:
+            emit('game_error', {'message': 'You must be logged in to play cards'})
+            return
+            
+        match = Match.query.get(data['match_id'])
+        if not match:
+            emit('game_error', {'message': 'Match not found'})
+            return
+            
+        # Check if user is in this match
+        if match.player1_id != current_user.id and match.player2_id != current_user.id:
+            emit('game_error', {'message': 'You are not in this match'})
+            return
+            
+        # Broadcast to the opponent
+        opponent_id = match.player2_id if match.player1_id == current_user.id else match.player1_id
+        if opponent_id:
+            with match_store.game(match) as game:
+                game_state = player_views(match, game.to_json())[opponent_id] if game else None
+            emit('card_played', {
+                'card': data['card'],
+                'row': data['row'],
+                'col': data['col'],
+                'gameState': game_state
+            }, room=str(opponent_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('submit_move')
+def handle_submit_move(data):
+    """Make a move over the socket: {match_id, move_id, type: 'play_card' |
+    'end_turn', card, row, col}. The return value is the ack, carrying the
+    new state and its version; the opponent gets a game_state_update. A
+    retried move_id is acked again without being replayed."""
+    move_id = data.get('move_id')
+    try:
+        if not current_user.is_authenticated:
+            return {'ok': False, 'move_id': move_id, 'error': 'You must be logged in to play cards'}
+        if not move_id:
+            return {'ok': False, 'move_id': move_id, 'error': 'Missing move_id'}
+            
+        match = Match.query.get(data.get('match_id'))
+        if not match or current_user.id not in (match.player1_id, match.player2_id):
+            return {'ok': False, 'move_id': move_id, 'error': 'Match not found'}
+            
+        dedup_key = f'{current_user.id}:{move_id}'
+        with match_store.game(match) as game:
+            ack = match_store.applied_move(match.id, dedup_key)
+            if ack:
+                return ack
+            if not game:
+                return {'ok': False, 'move_id': move_id, 'error': 'Game not initialized'}
+            db.session.refresh(match)  # it may have ended while this waited for the lock
+            if match.ended_at or game.winner:
+                return {'ok': False, 'move_id': move_id, 'error': 'Game is over', 'version': game.version}
+                
+            if data.get('type') == 'end_turn':
+                if game.current_turn != current_user.username:
+                    success, message = False, 'Not your turn'
+                else:
+                    game.end_turn()
+                    success, message = True, None
+            else:
+                success, message = play_move(game, data['card'], data['row'], data['col'], current_user.username)
+            if not success:
+                return {'ok': False, 'move_id': move_id, 'error': message, 'version': game.version}
+                
+            save_game(match, game)
+            game.check_winner()
+            # The mover and their opponent each get their own view
+            views = player_views(match, game.to_json())
+            ack = {'ok': True, 'move_id': move_id, 'version': game.version, 'state': views[current_user.id]}
+            match_store.record_move(match.id, dedup_key, ack)
+            
+        opponent_id = match.player2_id if match.player1_id == current_user.id else match.player1_id
+        if opponent_id:
+            emit('game_state_update', views[opponent_id], room=str(opponent_id))
+        return ack
+    except Exception as e:
+        return {'ok': False, 'move_id': move_id, 'error': str(e)}
+
+@socketio.on('card_flipped')
+def handle_card_flipped(data):
+    try:
+        if not current_user.is_authenticated:
+            emit('game_error', {'message': 'You must be logged in'})
+            return
+            
+        match = Match.query.get(data['match_id'])
+        if not match:
+            emit('game_error', {'message': 'Match not found'})
+            return
+            
+        # Check if user is in this match
+        if match.player1_id != current_user.id and match.player2_id != current_user.id:
+            emit('game_error', {'message': 'You are not in this match'})
+            return
+            
+        # Update game state, in order with the match's other moves
+        row, col = data['row'], data['col']
+        with match_store.game(match) as game:
+            if not game:
+                emit('game_error', {'message': 'Game not initialized'})
+                return
+            if 0 <= row < 3 and 0 <= col < 5 and game.grid[row][col]:
+                game.grid[row][col].is_captured = True
+                save_game(match, game)
+            game_state = game.to_json()
+            
+        # Broadcast to all players in the match, each with their own view
+        for user_id, view in player_views(match, game_state).items():
+            emit('card_flipped', {
+                'row': row,
+                'col': col,
+                'gameState': view
+            }, room=str(user_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('rematch_request')
+def handle_rematch_request(data):
+    try:
+        if not current_user.is_authenticated:
+            emit('game_error', {'message': 'You must be logged in'})
+            return
+            
+        match = Match.query.get(data['match_id'])
+        if not match:
+            emit('game_error', {'message': 'Match not found'})
+            return
+            
+        # Check if user is in this match
+        if match.player1_id != current_user.id and match.player2_id != current_user.id:
+            emit('game_error', {'message': 'You are not in this match'})
+            return
+            
+        # Send request to opponent
+        opponent_id = match.player2_id if match.player1_id == current_user.id else match.player1_id
+        if opponent_id:
+            emit('rematch_request', {
+                'requester': current_user.username,
+                'match_id': match.id
+            }, room=str(opponent_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('accept_rematch')
+def handle_accept_rematch(data):
+    try:
+        match = Match.query.get(data['match_id'])
+        if not match:
+            emit('game_error', {'message': 'Match not found'})
+            return
+            
+        # Create new match with same players
+        new_match = Match(
+            player1_id=match.player1_id,
+            player2_id=match.player2_id,
+            started_at=datetime.utcnow()
+        )
+        db.session.add(new_match)
+        db.session.commit()
+        
+        # Notify both players
+        emit('rematch_accepted', {'match_id': new_match.id}, room=str(match.player1_id))
+        emit('rematch_accepted', {'match_id': new_match.id}, room=str(match.player2_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('decline_rematch')
+def handle_decline_rematch(data):
+    try:
+        match = Match.query.get(data['match_id'])
+        if not match:
+            return
+            
+        # Notify requester
+        opponent_id = match.player2_id if match.player1_id == current_user.id else match.player1_id
+        emit('rematch_declined', room=str(opponent_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('cancel_rematch_request')
+def handle_cancel_rematch(data):
+    try:
+        match = Match.query.get(data['match_id'])
+        if not match:
+            return
+            
+        # Notify opponent
+        opponent_id = match.player2_id if match.player1_id == current_user.id else match.player1_id
+        emit('rematch_cancelled', room=str(opponent_id))
+    except Exception as e:
+        emit('game_error', {'message': str(e)})
+
+@socketio.on('place_bet')
+def handle_place_bet(data):
+    if not current_user.is_authenticated:
+        emit('bet_error', {'message': 'You must be logged in to place bets'})
+        return
+
+    match = Match.query.get(data['match_id'])
+    if not match:
+        emit('bet_error', {'message': 'Match not found'})
+        return
+
+    # Check if user is in this match
+    if match.player1_id != current_user.id and match.player2_id != current_user.id:
+        emit('bet_error', {'message': 'You are not in this match'})
+        return
+
+    # Check if betting is still allowed (before half score)
+    total_cards = sum(1 for row in match.game_state['grid'] for card in row if card)
+    if total_cards >= 8:  # More than half the board is filled
+        emit('bet_error', {'message': 'Betting is no longer allowed at this stage'})
+        return
+
+    # Check if betting is already locked
+    if match.bet_locked:
+        emit('bet_error', {'message': 'Betting is already locked for this match'})
+        return
+
+    bet_amount = data.get('amount', 0)
+    if not isinstance(bet_amount, int) or bet_amount <= 0:
+        emit('bet_error', {'message': 'Invalid bet amount'})
+        return
+
+    # Lock the match and take the coins in one transaction; both updates are
+    # conditional so concurrent bets can't double-lock or overdraw
+    locked = Match.query.filter(Match.id == match.id, Match.bet_locked.isnot(True)).update(
+        {Match.bet_amount: bet_amount, Match.bet_locked: True},
+        synchronize_session=False
+    )
+    if not locked:
+        db.session.rollback()
+        emit('bet_error', {'message': 'Betting is already locked for this match'})
+        return
+
+    if not ledger.debit(current_user.id, bet_amount, 'Bet placed', match.id):
+        db.session.rollback()
+        emit('bet_error', {'message': 'Not enough SmashCoins'})
+        return
+
+    db.session.commit()
+
+    # Notify both players
+    emit('bet_placed', {
+        'amount': bet_amount,
+        'by': current_user.username
+    }, room=str(match.player1_id))
+    
+    if match.player2_id:
+        emit('bet_placed', {
+            'amount': bet_amount,
+            'by': current_user.username
+        }, room=str(match.player2_id))
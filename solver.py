@@ -0,0 +1,247 @@
+"""Exact endgame search.
+
+Captures are deterministic and the server knows every hand and the order of
+every deck, so once only a few cells are empty the rest of the game can be
+searched to the end. The solver runs a negamax with alpha-beta over the
+board, both hands and the cards each player will draw, scoring a finished
+board as the player to move's card count minus their opponent's.
+
+Positions are cached under a canonical key. Flipping the board left-right
+turns every left/right duel into a right/left one, so it maps a position to
+an equivalent one when every card's Earth and Air are swapped; flipping it
+top-bottom does the same with Fire and Water. The key is the smallest of
+the four mirror images, so all four share one cache entry. The cache is a
+bounded LRU kept across searches: a hint and the computer's reply in the
+same endgame mostly re-read what an earlier search found.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from engine import CharacterCard
+
+ROWS, COLS = 3, 5
+ELEMENTS = ('Fire', 'Water', 'Air', 'Earth')
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# For each cell, the neighbours a card placed there duels with, as
+# (neighbour cell, element compared). Element indexes follow ELEMENTS
+NEIGHBOURS = []
+for _row in range(ROWS):
+    for _col in range(COLS):
+        _duels = []
+        if _row > 0:
+            _duels.append(((_row - 1) * COLS + _col, 0))  # above: Fire
+        if _row < ROWS - 1:
+            _duels.append(((_row + 1) * COLS + _col, 1))  # below: Water
+        if _col > 0:
+            _duels.append((_row * COLS + _col - 1, 3))  # left: Earth
+        if _col < COLS - 1:
+            _duels.append((_row * COLS + _col + 1, 2))  # right: Air
+        NEIGHBOURS.append(tuple(_duels))
+
+# The four mirror images as (cell each cell is read from, element order)
+SYMMETRIES = []
+for _flip_rows in (False, True):
+    for _flip_cols in (False, True):
+        _cells = tuple((ROWS - 1 - i // COLS if _flip_rows else i // COLS) * COLS +
+                       (COLS - 1 - i % COLS if _flip_cols else i % COLS) for i in range(ROWS * COLS))
+        _elements = ((1, 0) if _flip_rows else (0, 1)) + ((3, 2) if _flip_cols else (2, 3))
+        SYMMETRIES.append((_cells, _elements))
+
+
+def mirror_card(card, elements):
+    return (card[elements[0]], card[elements[1]], card[elements[2]], card[elements[3]]) + card[4:]
+
+def canonical_key(board, hands, draws, side):
+    # Mirror the board first: hands and draws only need mirroring for the
+    # images tied for the smallest board
+    images = [(tuple(() if board[i] is None else mirror_card(board[i], elements) for i in cells), elements)
+              for cells, elements in SYMMETRIES]
+    smallest = min(image for image, _ in images)
+    return min(
+        (image,
+         tuple(tuple(sorted(mirror_card(card, elements) for card in hand)) for hand in hands),
+         tuple(tuple(mirror_card(card, elements) for card in cards) for cards in draws),
+         side)
+        for image, elements in images if image == smallest)
+
+def place(board, cell, card, side):
+    # The board after `side` plays `card` (element tuple) into `cell`, and
+    # how many cards it captured
+    board = list(board)
+    board[cell] = card + (side,)
+    captured = 0
+    for neighbour, element in NEIGHBOURS[cell]:
+        other = board[neighbour]
+        if other is not None and other[4] != side and card[element] >= other[element]:
+            board[neighbour] = other[:4] + (side,)
+            captured += 1
+    return tuple(board), captured
+
+def captures(board, cell, card, side):
+    # How many cards place() would capture, without building the board
+    captured = 0
+    for neighbour, element in NEIGHBOURS[cell]:
+        other = board[neighbour]
+        if other is not None and other[4] != side and card[element] >= other[element]:
+            captured += 1
+    return captured
+
+def margin(board, side):
+    # Cards `side` owns minus cards the opponent owns
+    return sum(1 if card[4] == side else -1 for card in board if card is not None)
+
+
+class EndgameSolver:
+    def __init__(self, max_empty=5, maxsize=200000):
+        self.max_empty = max_empty  # search positions with at most this many empty cells
+        self.maxsize = maxsize
+        self.cache = OrderedDict()  # canonical key -> (value, bound)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def position(self, game):
+        """(board, hands, draws, side) for the player on turn: cards as
+        element tuples, board cells with the owning side (0 for player 1)
+        appended, and each side's upcoming draws in deck order."""
+        players = (game.player1, game.player2)
+        sides = {player.name: side for side, player in enumerate(players)}
+        board = tuple(
+            tuple(card.elements[e] for e in ELEMENTS) + (sides[card.owner],)
+            if isinstance(card, CharacterCard) else None
+            for row in game.grid for card in row)
+        empty = board.count(None)
+        hands = tuple(tuple(tuple(card.elements[e] for e in ELEMENTS) for card in player.hand
+                            if isinstance(card, CharacterCard)) for player in players)
+        side = sides[game.current_turn]
+        # A side draws after each of its placements but the last
+        turns = ((empty + 1) // 2, empty // 2) if side == 0 else (empty // 2, (empty + 1) // 2)
+        draws = tuple(tuple(tuple(card.elements[e] for e in ELEMENTS) for card in player.deck[:max(0, turns[s] - 1)]
+                            if isinstance(card, CharacterCard)) for s, player in enumerate(players))
+        return board, hands, draws, side
+
+    def best_move(self, game):
+        """(card, row, col, margin) of a perfect placement for the player on
+        turn, where margin is the card lead they end the game with against
+        perfect replies; None if too many cells are empty to search or they
+        have no character card."""
+        board, hands, draws, side = self.position(game)
+        empty = board.count(None)
+        if not empty or empty > self.max_empty or not hands[side]:
+            return None
+        with self.lock:
+            value, cell, stats = self.search_root(board, hands, draws, side)
+        player = game.player1 if side == 0 else game.player2
+        card = next(card for card in player.hand if isinstance(card, CharacterCard) and
+                    tuple(card.elements[e] for e in ELEMENTS) == stats)
+        return card, cell // COLS, cell % COLS, value
+
+    def search_root(self, board, hands, draws, side):
+        best = None
+        alpha = -ROWS * COLS - 1
+        score = margin(board, side)
+        for captured, cell, card, new_hands, new_draws in self.moves(board, hands, draws, side):
+            value = -self.negamax(place(board, cell, card, side)[0], new_hands, new_draws, 1 - side,
+                                  -(score + 1 + 2 * captured), -ROWS * COLS - 1, -alpha)
+            if best is None or value > best[0]:
+                best = (value, cell, card)
+                alpha = max(alpha, value)
+        return best
+
+    def moves(self, board, hands, draws, side):
+        # Every distinct card in every empty cell, as (captures, cell, card,
+        # hands and draws after it), biggest captures first so alpha-beta
+        # cuts early; boards are only built for the moves searched
+        hand = hands[side]
+        children = []
+        for card in set(hand):
+            rest = list(hand)
+            rest.remove(card)
+            side_draws = draws[side]
+            if side_draws:
+                rest.append(side_draws[0])
+                side_draws = side_draws[1:]
+            new_hands = (tuple(rest), hands[1]) if side == 0 else (hands[0], tuple(rest))
+            new_draws = (side_draws, draws[1]) if side == 0 else (draws[0], side_draws)
+            for cell in range(ROWS * COLS):
+                if board[cell] is None:
+                    children.append((captures(board, cell, card, side), cell, card, new_hands, new_draws))
+        children.sort(key=lambda child: -child[0])
+        return children
+
+    def negamax(self, board, hands, draws, side, score, alpha, beta):
+        # `score` is margin(board, side), carried along instead of recounted
+        empty = board.count(None)
+        if not empty:
+            return score
+        if not hands[side]:
+            if not hands[1 - side]:
+                return score
+            return -self.negamax(board, hands, draws, 1 - side, -score, -beta, -alpha)
+        if empty == 1:
+            cell = board.index(None)
+            return score + 1 + 2 * max(captures(board, cell, card, side) for card in set(hands[side]))
+        if empty == 2 and hands[1 - side]:
+            return self.last_two(board, hands, side, score, beta)
+
+        key = canonical_key(board, hands, draws, side)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            value, bound = entry
+            if bound == EXACT:
+                return value
+            if bound == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+        else:
+            self.misses += 1
+
+        original_alpha = alpha
+        best = -ROWS * COLS - 1
+        for captured, cell, card, new_hands, new_draws in self.moves(board, hands, draws, side):
+            value = -self.negamax(place(board, cell, card, side)[0], new_hands, new_draws, 1 - side,
+                                  -(score + 1 + 2 * captured), -beta, -alpha)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best <= original_alpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.cache[key] = (best, bound)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return best
+
+    def last_two(self, board, hands, side, score, beta):
+        # Two cells left: each placement is answered by the opponent's best
+        # card in the other cell. Cheaper to search outright than to key
+        first, second = [cell for cell in range(ROWS * COLS) if board[cell] is None]
+        replies = set(hands[1 - side])
+        best = -ROWS * COLS - 1
+        for card in set(hands[side]):
+            for cell, other in ((first, second), (second, first)):
+                new_board, captured = place(board, cell, card, side)
+                value = score - 2 * max(captures(new_board, other, reply, 1 - side) for reply in replies) + 2 * captured
+                if value > best:
+                    best = value
+                    if best >= beta:
+                        return best
+        return best
+
@@ -18,7 +18,8 @@ const setupWebSocket = (socket) => {
         showAlert('Connection lost. Attempting to reconnect...', 'error');
     });
 
-    socket.on('reconnect', () => {
+    // Reconnection events are emitted by the manager, not the socket
+    socket.io.on('reconnect', () => {
         showAlert('Connection restored!', 'success');
     });
     
@@ -29,6 +30,21 @@ const setupWebSocket = (socket) => {
     });
 };
 
+// Connect with this tab's resume token, so a reconnect or a page change gets
+// the previous connection's rooms back instead of starting over
+const connectSocket = () => {
+    const socket = io({
+        auth: (cb) => cb({ resume_token: sessionStorage.getItem('resumeToken') })
+    });
+    socket.on('connection_success', (data) => {
+        if (data.resume_token) {
+            sessionStorage.setItem('resumeToken', data.resume_token);
+        }
+    });
+    setupWebSocket(socket);
+    return socket;
+};
+
 // SmashCoins display update function
 const updateCoinDisplay = (newAmount) => {
     const coinDisplay = document.querySelector('.coin-value');
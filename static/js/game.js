@@ -1,7 +1,7 @@
 class GameClient {
     constructor(matchId) {
         this.matchId = matchId;
-        this.socket = io();
+        this.socket = connectSocket();
         this.gameState = null;
         this.selectedCard = null;
         this.selectedCell = null;
@@ -79,7 +79,16 @@ class GameClient {
     }
 
     setupSocketListeners() {
+        // After a reconnect, fetch only what was missed while offline
+        this.socket.on('connect', () => {
+            if (this.gameState) {
+                this.resumeMatch();
+            }
+        });
+
         this.socket.on('game_state_update', (data) => {
+            // Updates can overtake each other; never go back to an older state
+            if (data && this.gameState && data.version < this.gameState.version) return;
             console.log('Received game state update', data);
             this.gameState = data;
             this.renderGameState();
@@ -579,23 +588,7 @@ class GameClient {
         }
         
         try {
-            const response = await fetch('/play_card', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    match_id: this.matchId,
-                    card: this.selectedCard,
-                    row: row,
-                    col: col
-                })
-            });
-
-            const data = await response.json();
-            if (!response.ok) {
-                throw new Error(data.error || 'Failed to play card');
-            }
+            const data = await this.submitMove({ type: 'play_card', card: this.selectedCard, row: row, col: col });
 
             this.gameState = data;
             this.selectedCard = null;
@@ -616,17 +609,7 @@ class GameClient {
         }
 
         try {
-            const response = await fetch('/end_turn', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                }
-            });
-
-            const data = await response.json();
-            if (!response.ok) {
-                throw new Error(data.error || 'Failed to end turn');
-            }
+            const data = await this.submitMove({ type: 'end_turn' });
 
             this.gameState = data;
             this.renderGameState();
@@ -639,13 +622,83 @@ class GameClient {
         }
     }
 
+    // Moves go over the already-open socket with a client-generated id. The
+    // ack carries the new state; a retry after a lost ack reuses the id, so
+    // the server answers it without playing the move twice
+    submitMove(move, attempts = 3) {
+        const payload = { ...move, match_id: this.matchId, move_id: this.newMoveId() };
+        return new Promise((resolve, reject) => {
+            let done = false;
+            const send = (attempt) => {
+                const timer = setTimeout(() => {
+                    if (done) return;
+                    if (attempt < attempts) {
+                        send(attempt + 1);
+                    } else {
+                        done = true;
+                        reject(new Error('The server did not answer, please try again'));
+                    }
+                }, 5000);
+                this.socket.emit('submit_move', payload, (ack) => {
+                    clearTimeout(timer);
+                    if (done) return;
+                    done = true;
+                    if (ack.ok) {
+                        resolve(ack.state);
+                    } else {
+                        reject(new Error(ack.error || 'Move failed'));
+                    }
+                });
+            };
+            send(1);
+        });
+    }
+
+    resumeMatch() {
+        const since = { match_id: this.matchId, version: this.gameState.version };
+        this.socket.emit('resume_match', since, (reply) => {
+            if (reply.mode === 'delta') {
+                reply.deltas.forEach(delta => this.applyDelta(delta));
+            } else if (reply.mode === 'full' && reply.state) {
+                this.gameState = reply.state;
+            } else {
+                return;
+            }
+            this.renderGameState();
+        });
+    }
+
+    applyDelta(delta) {
+        // Deltas only apply on top of the version they were taken from
+        if (delta.base !== this.gameState.version) return;
+        Object.assign(this.gameState, delta.set);
+        Object.entries(delta.players).forEach(([side, fields]) => {
+            Object.assign(this.gameState[side], fields);
+        });
+        Object.entries(delta.hands).forEach(([side, hand]) => {
+            const previous = this.gameState[side].hand;
+            this.gameState[side].hand = hand.keep.map(i => previous[i]).concat(hand.add);
+        });
+        delta.cells.forEach(([row, col, card]) => {
+            this.gameState.grid[row][col] = card;
+        });
+    }
+
+    newMoveId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
     async simulateComputerTurn() {
         try {
             const response = await fetch('/computer_turn', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                }
+                },
+                body: JSON.stringify({ match_id: this.matchId })
             });
 
             const data = await response.json();
@@ -682,7 +735,8 @@ class GameClient {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
-                    }
+                    },
+                    body: JSON.stringify({ match_id: this.matchId })
                 });
 
                 if (!response.ok) {
@@ -1017,23 +1071,7 @@ class GameClient {
             const col = parseInt(cell.dataset.col);
 
             // Send play card request
-            const response = await fetch('/play_card', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    match_id: this.matchId,
-                    card: cardData,
-                    row: row,
-                    col: col
-                })
-            });
-
-            const data = await response.json();
-            if (!response.ok) {
-                throw new Error(data.error || 'Failed to play card');
-            }
+            const data = await this.submitMove({ type: 'play_card', card: cardData, row: row, col: col });
 
             // Update game state and render
             this.gameState = data;
@@ -1138,23 +1176,7 @@ class GameClient {
         }
 
         try {
-            const response = await fetch('/play_card', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    match_id: this.matchId,
-                    card: this.selectedCard,
-                    row: row,
-                    col: col
-                })
-            });
-
-            const data = await response.json();
-            if (!response.ok) {
-                throw new Error(data.error || 'Failed to play card');
-            }
+            const data = await this.submitMove({ type: 'play_card', card: this.selectedCard, row: row, col: col });
 
             this.gameState = data;
             this.selectedCard = null;
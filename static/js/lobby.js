@@ -4,7 +4,7 @@ class LobbyClient {
         this.initializeGreeting();
         
         // Then setup other functionality
-        this.socket = io();
+        this.socket = connectSocket();
         this.bindEvents();
         this.setupSocketListeners();
         this.updateOnlinePlayers();
@@ -62,6 +62,7 @@ class LobbyClient {
 
         this.socket.on('matchmaking_cancelled', () => {
             this.isSearching = false;
+            this.stopSearching();
             document.getElementById('matchModal').classList.remove('active');
             showAlert('Matchmaking cancelled', 'info');
         });
@@ -79,10 +80,6 @@ class LobbyClient {
             showAlert('Connected to server', 'success');
         });
 
-        this.socket.on('disconnect', () => {
-            showAlert('Connection lost. Attempting to reconnect...', 'error');
-        });
-
         this.socket.on('chat_message', (data) => {
             this.addChatMessage(data.from, data.message);
         });
@@ -149,6 +146,21 @@ class LobbyClient {
             dots = (dots + 1) % 4;
             this.updateMatchmakingStatus('Searching for opponents' + '.'.repeat(dots));
         }, 500);
+
+        // Keep our place in the queue; search again if the server dropped it
+        // (e.g. after a reconnect)
+        this.heartbeatInterval = setInterval(() => {
+            this.socket.emit('matchmaking_heartbeat', (ack) => {
+                if (this.isSearching && ack && !ack.queued) {
+                    this.socket.emit('find_match');
+                }
+            });
+        }, 10000);
+    }
+
+    stopSearching() {
+        clearInterval(this.matchmakingInterval);
+        clearInterval(this.heartbeatInterval);
     }
 
     cancelMatchmaking() {
@@ -158,7 +170,7 @@ class LobbyClient {
 
         this.socket.emit('cancel_matchmaking');
         this.isSearching = false;
-        clearInterval(this.matchmakingInterval);
+        this.stopSearching();
         document.getElementById('matchModal').classList.remove('active');
         showAlert('Matchmaking cancelled', 'info');
     }
@@ -171,7 +183,7 @@ class LobbyClient {
     }
 
     handleMatchFound(data) {
-        clearInterval(this.matchmakingInterval);
+        this.stopSearching();
         showAlert(`Match found! Playing against ${data.opponent}`, 'success');
         setTimeout(() => {
             window.location.href = `/game/${data.match_id}`;
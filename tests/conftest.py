@@ -0,0 +1,60 @@
+import pytest
+
+from extensions import db
+from leaderboard import Leaderboard
+from main import create_app
+from models import User
+import services
+
+PASSWORD = 'secret1'
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    # One app per run: the socketio and database extensions are module-level
+    # singletons that don't expect to be initialised more than once
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}",
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'LOOP_WATCHDOG': False,
+        # Cheap hashes keep logins fast
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    return app
+
+@pytest.fixture(autouse=True)
+def database(app, monkeypatch):
+    # Fresh tables and empty in-memory caches for every test
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        services.user_cache.clear()
+        services.match_store.games.clear()
+        services.match_store.acks.clear()
+        monkeypatch.setattr(services, 'leaderboard', Leaderboard())
+        yield db
+        db.session.remove()
+
+@pytest.fixture
+def make_user(database):
+    def make_user(username, **columns):
+        user = User(username=username, email=f'{username}@example.com', **columns)
+        user.set_password(PASSWORD)
+        database.session.add(user)
+        database.session.commit()
+        return user
+    return make_user
+
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302, response.data[:300]
+        return client
+    return login
+
+@pytest.fixture
+def client_for_anonymous(app):
+    return app.test_client()
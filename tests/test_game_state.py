@@ -0,0 +1,111 @@
+"""Players are only sent their own hand, whichever way the state reaches them,
+and moves only apply to matches still in progress."""
+from datetime import datetime
+
+import pytest
+
+import routes
+from extensions import socketio
+from models import Match
+from services import match_store
+
+
+@pytest.fixture
+def pvp_match(app, make_user, login):
+    make_user('alice')
+    make_user('bobby')
+    clients = {'alice': login('alice'), 'bobby': login('bobby')}
+    sockets = {name: socketio.test_client(app, flask_test_client=client) for name, client in clients.items()}
+    sockets['alice'].emit('find_match')
+    sockets['bobby'].emit('find_match')
+    found = [message for message in sockets['alice'].get_received() if message['name'] == 'match_found']
+    assert found
+    match_id = found[0]['args'][0]['match_id']
+    yield match_id, clients, sockets
+    for sock in sockets.values():
+        sock.disconnect()
+
+def assert_hides_opponent(state, viewer):
+    mine, theirs = ('player1', 'player2') if state['player1']['name'] == viewer else ('player2', 'player1')
+    assert all(card['type'] != 'CardBack' for card in state[mine]['hand'])
+    assert all(card == {'type': 'CardBack', 'name': 'Hidden Card'} for card in state[theirs]['hand'])
+
+def test_state_hides_opponent_hand(pvp_match):
+    match_id, clients, _ = pvp_match
+    for name, client in clients.items():
+        assert_hides_opponent(client.get(f'/game/{match_id}/state').get_json(), name)
+
+def test_submit_move_ack_and_push_hide_other_hand(pvp_match):
+    match_id, clients, sockets = pvp_match
+    state = clients['alice'].get(f'/game/{match_id}/state').get_json()
+    mover = state['current_turn']
+    opponent = 'bobby' if mover == 'alice' else 'alice'
+    own = clients[mover].get(f'/game/{match_id}/state').get_json()
+    own_key = 'player1' if own['player1']['name'] == mover else 'player2'
+    card = next(card for card in own[own_key]['hand'] if card['type'] == 'CharacterCard')
+    sockets[opponent].get_received()
+
+    ack = sockets[mover].emit('submit_move', {'match_id': match_id, 'move_id': 'm1', 'type': 'play_card',
+                                              'card': card, 'row': 0, 'col': 0}, callback=True)
+    assert ack['ok'], ack
+    assert_hides_opponent(ack['state'], mover)
+
+    pushes = [message['args'][0] for message in sockets[opponent].get_received()
+              if message['name'] == 'game_state_update']
+    assert pushes
+    assert_hides_opponent(pushes[-1], opponent)
+
+def test_resume_deltas_hide_opponent_draws(pvp_match):
+    match_id, clients, sockets = pvp_match
+    state = clients['alice'].get(f'/game/{match_id}/state').get_json()
+    mover = state['current_turn']
+    opponent = 'bobby' if mover == 'alice' else 'alice'
+    own = clients[mover].get(f'/game/{match_id}/state').get_json()
+    own_key = 'player1' if own['player1']['name'] == mover else 'player2'
+    card = next(card for card in own[own_key]['hand'] if card['type'] == 'CharacterCard')
+    sockets[mover].emit('submit_move', {'match_id': match_id, 'move_id': 'm1', 'type': 'play_card',
+                                        'card': card, 'row': 0, 'col': 0}, callback=True)
+
+    reply = sockets[opponent].emit('resume_match', {'match_id': match_id, 'version': own['version']}, callback=True)
+    assert reply['mode'] == 'delta'
+    drawn = [card for delta in reply['deltas'] for card in delta['hands'].get(own_key, {}).get('add', [])]
+    assert drawn
+    assert all(card == {'type': 'CardBack', 'name': 'Hidden Card'} for card in drawn)
+
+def test_pvp_hint_does_not_search_hidden_cards(pvp_match, monkeypatch):
+    # The endgame solver reads the opponent's hand and deck
+    monkeypatch.setattr(routes.endgame, 'best_move', lambda game: pytest.fail('solver used in a PvP match'))
+    match_id, clients, _ = pvp_match
+    mover = clients['alice'].get(f'/game/{match_id}/state').get_json()['current_turn']
+    own = clients[mover].get(f'/game/{match_id}/state').get_json()
+    own_key = 'player1' if own['player1']['name'] == mover else 'player2'
+
+    hint = clients[mover].get(f'/game/{match_id}/hint').get_json()['hint']
+    assert hint['card'] in own[own_key]['hand']
+    assert own['grid'][hint['row']][hint['col']] is None
+
+def test_move_racing_the_end_of_a_match_is_refused(app, database, make_user, login, monkeypatch):
+    alice = make_user('alice')
+    match = Match(player1_id=alice.id, player2_id=None)
+    database.session.add(match)
+    database.session.commit()
+    match_id = match.id
+    client = login('alice')
+    state = client.get(f'/game/{match_id}/state').get_json()
+    card = next(card for card in state['player1']['hand'] if card['type'] == 'CharacterCard')
+
+    # A surrender commits on another connection while the move waits for the lock
+    class EndsMatchFirst:
+        def __enter__(self):
+            with database.engine.begin() as connection:
+                connection.execute(Match.__table__.update().where(Match.__table__.c.id == match_id)
+                                   .values(ended_at=datetime.utcnow()))
+        def __exit__(self, *exc):
+            return False
+    monkeypatch.setattr(match_store, 'lock', lambda match_id: EndsMatchFirst())
+
+    response = client.post('/play_card', json={'match_id': match_id, 'card': card, 'row': 0, 'col': 0})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'No active game'
+    database.session.expire_all()
+    assert Match.query.get(match_id).game_state['version'] == state['version']
@@ -0,0 +1,16 @@
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+
+from hashing import PasswordHasher
+
+
+def test_method_without_iterations_matches_werkzeug_default():
+    hasher = PasswordHasher(method='pbkdf2:sha256')
+    pwhash = hasher.hash('secret1')
+    assert pwhash.startswith(f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}$')
+    assert not hasher.needs_rehash(pwhash)
+
+def test_changed_iterations_or_salt_need_rehash():
+    pwhash = PasswordHasher(method='pbkdf2:sha256:1000').hash('secret1')
+    assert PasswordHasher(method='pbkdf2:sha256:2000').needs_rehash(pwhash)
+    assert PasswordHasher(method='pbkdf2:sha256:1000', salt_length=8).needs_rehash(pwhash)
+    assert not PasswordHasher(method='pbkdf2:sha256:1000').needs_rehash(pwhash)
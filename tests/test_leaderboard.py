@@ -0,0 +1,38 @@
+from models import LeaderboardEntry
+from query_profiler import profile_queries
+import services
+
+
+def saved_ranking():
+    return [(entry.rank, entry.user_id, entry.rating)
+            for entry in LeaderboardEntry.query.order_by(LeaderboardEntry.rank)]
+
+def current_ranking():
+    board = services.get_leaderboard()
+    return [(entry['rank'], entry['user_id'], entry['rating']) for entry in board.top(len(board))]
+
+def test_snapshot_writes_only_changed_ranks(database, make_user):
+    users = [make_user(f'player{i}', rating=1000 + 10 * i) for i in range(20)]
+    services.snapshot_leaderboard()
+    assert saved_ranking() == current_ranking()
+
+    first_snapshot = LeaderboardEntry.query.first().snapshot_at
+
+    # Two players swap places; every other rank is unchanged
+    users[0].rating = 1015
+    database.session.commit()
+    services.sync_leaderboard(users[0])
+    with profile_queries() as profile:
+        services.snapshot_leaderboard()
+    assert saved_ranking() == current_ranking()
+    writes = [statement for statement, _, _ in profile.statements if not statement.lstrip().startswith('SELECT')]
+    assert len(writes) == 1 and writes[0].lstrip().startswith('UPDATE')
+    assert LeaderboardEntry.query.filter(LeaderboardEntry.snapshot_at > first_snapshot).count() == 2
+
+def test_snapshot_drops_ranks_of_removed_players(database, make_user):
+    users = [make_user(f'player{i}', rating=1000 + i) for i in range(5)]
+    services.snapshot_leaderboard()
+    services.get_leaderboard().remove(users[0].id)
+    services.snapshot_leaderboard()
+    assert saved_ranking() == current_ranking()
+    assert len(saved_ranking()) == 4
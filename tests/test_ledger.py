@@ -0,0 +1,14 @@
+from services import ledger
+
+
+def test_accounts_opened_at_startup_reconcile_after_a_credit(database, make_user):
+    # make_user skips registration, like an account created before the ledger
+    alice = make_user('alice')
+    assert ledger.open_missing_accounts() == 1
+    database.session.commit()
+
+    ledger.credit(alice.id, 10, 'Match reward')
+    database.session.commit()
+    assert ledger.balances([alice.id]) == {alice.id: 110}
+    assert ledger.reconcile() == []
+    assert ledger.open_missing_accounts() == 0
@@ -0,0 +1,45 @@
+import pytest
+
+from metrics import Metrics, instrument_socketio
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, message, namespace=None):
+        def decorator(handler):
+            self.handlers[message] = handler
+            return handler
+        return decorator
+
+    def emit(self, event, *args, **kwargs):
+        pass
+
+@pytest.fixture
+def socketio():
+    socketio = FakeSocketIO()
+    instrument_socketio(socketio, Metrics())
+    return socketio
+
+def test_connect_handler_without_auth_parameter(socketio):
+    calls = []
+
+    @socketio.on('connect')
+    def connect():
+        calls.append(())
+
+    socketio.handlers['connect']({'token': 'x'})
+    assert calls == [()]
+
+def test_connect_handler_error_propagates_and_runs_once(socketio):
+    calls = []
+
+    @socketio.on('connect')
+    def connect(auth=None):
+        calls.append(auth)
+        raise TypeError('bug in the handler')
+
+    with pytest.raises(TypeError, match='bug in the handler'):
+        socketio.handlers['connect']({'token': 'x'})
+    assert calls == [{'token': 'x'}]
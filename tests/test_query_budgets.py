@@ -0,0 +1,103 @@
+"""Query budgets for the endpoints that used to run a query per row.
+
+Each test fills the tables with more rows than the N+1 threshold and checks
+the request against the budget configured in QUERY_BUDGETS, so a lookup
+added inside a loop fails here.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from engine import Game
+from models import ChatMessage, Friend, Match
+from query_profiler import QueryBudgetExceeded, profile_queries, query_budget
+
+OPPONENTS = 6
+
+
+@pytest.fixture
+def players(make_user):
+    alice = make_user('alice')
+    return alice, [make_user(f'rival{i}') for i in range(OPPONENTS)]
+
+@pytest.fixture
+def finished_matches(database, players):
+    alice, rivals = players
+    now = datetime.utcnow()
+    for i, rival in enumerate(rivals):
+        state = Game(alice.username, rival.username, seed=i).to_state()
+        state['final_scores'] = {'player1': {'cards': 8}, 'player2': {'cards': 7}}
+        database.session.add(Match(player1_id=alice.id, player2_id=rival.id, winner_id=alice.id,
+                                   started_at=now - timedelta(minutes=10), ended_at=now - timedelta(minutes=i),
+                                   game_state=state))
+    database.session.commit()
+
+@pytest.fixture
+def live_matches(database, players):
+    _, rivals = players
+    for first, second in zip(rivals[::2], rivals[1::2]):
+        database.session.add(Match(player1_id=first.id, player2_id=second.id,
+                                   game_state=Game(first.username, second.username).to_state()))
+    database.session.commit()
+
+@pytest.fixture
+def chat_history(database, players):
+    alice, rivals = players
+    friend = rivals[0]
+    database.session.add(Friend(user_id=alice.id, friend_id=friend.id, status='accepted'))
+    for i in range(10):
+        sender, receiver = (alice, friend) if i % 2 else (friend, alice)
+        database.session.add(ChatMessage(sender_id=sender.id, receiver_id=receiver.id, message=f'message {i}'))
+    database.session.commit()
+    return friend
+
+
+def budget(app, endpoint):
+    return app.config['QUERY_BUDGETS'][f'main.{endpoint}']
+
+def test_player_profile(app, login, finished_matches):
+    client = login('alice')
+    with query_budget(budget(app, 'get_player_profile')) as profile:
+        response = client.get('/api/player/alice')
+    assert response.status_code == 200
+    assert len(response.get_json()['match_history']) == OPPONENTS
+    profile.assert_no_n_plus_one()
+
+def test_live_matches(app, client_for_anonymous, live_matches):
+    with query_budget(budget(app, 'get_live_matches')) as profile:
+        response = client_for_anonymous.get('/api/live-matches')
+    assert response.status_code == 200
+    assert len(response.get_json()['matches']) == OPPONENTS // 2
+    profile.assert_no_n_plus_one()
+
+def test_previous_matches(app, client_for_anonymous, finished_matches):
+    with query_budget(budget(app, 'get_previous_matches')) as profile:
+        response = client_for_anonymous.get('/api/previous-matches')
+    assert response.status_code == 200
+    assert len(response.get_json()['matches']) == OPPONENTS
+    profile.assert_no_n_plus_one()
+
+def test_chat_history(app, login, players, chat_history):
+    alice, _ = players
+    client = login('alice')
+    with query_budget(budget(app, 'get_chat_history')) as profile:
+        response = client.get(f'/api/chat/{chat_history.username}')
+    assert response.status_code == 200
+    assert len(response.get_json()['messages']) == 10
+    profile.assert_no_n_plus_one()
+    assert not ChatMessage.query.filter_by(receiver_id=alice.id, is_read=False).count()
+
+def test_budget_overrun_fails(app, client_for_anonymous, finished_matches):
+    # The guard itself: a budget below what the endpoint needs must fail
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(0):
+            client_for_anonymous.get('/api/previous-matches')
+
+def test_repeated_statements_are_flagged(database, players):
+    _, rivals = players
+    with profile_queries() as profile:
+        for rival in rivals:
+            database.session.expire(rival)
+            rival.username
+    with pytest.raises(QueryBudgetExceeded):
+        profile.assert_no_n_plus_one()
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from models import Match, User
+from rerate import rerate
+from services import STALE_MATCH_AFTER, reap_stale_matches
+
+
+def test_reaped_undealt_matches_are_not_rated(database, make_user):
+    alice = make_user('alice')
+    bobby = make_user('bobby')
+    abandoned = datetime.utcnow() - timedelta(seconds=STALE_MATCH_AFTER + 60)
+    # A PvP lobby and a computer game nobody ever loaded
+    database.session.add(Match(player1_id=alice.id, player2_id=bobby.id, started_at=abandoned, last_move_at=abandoned))
+    database.session.add(Match(player1_id=bobby.id, player2_id=None, started_at=abandoned, last_move_at=abandoned))
+    database.session.commit()
+
+    assert reap_stale_matches() == 2
+    assert Match.query.filter(Match.ended_at.is_(None)).count() == 0
+
+    replay = rerate(batch_size=10)
+    assert replay.matches_replayed == 0
+    for user in User.query.all():
+        database.session.refresh(user)
+        assert (user.rating, user.games_played, user.games_won) == (1000, 0, 0)
+
+def test_played_matches_are_still_rated(database, make_user):
+    alice = make_user('alice')
+    bobby = make_user('bobby')
+    database.session.add(Match(player1_id=alice.id, player2_id=bobby.id, winner_id=alice.id,
+                               ended_at=datetime.utcnow(), game_state={'winner': 'alice'}))
+    database.session.commit()
+
+    replay = rerate(batch_size=10)
+    assert replay.matches_replayed == 1
+    database.session.refresh(alice)
+    database.session.refresh(bobby)
+    assert alice.rating > 1000 > bobby.rating
+    assert (alice.games_played, alice.games_won, bobby.games_played) == (1, 1, 1)
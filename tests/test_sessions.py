@@ -0,0 +1,30 @@
+from flask import g
+
+from sessions import SessionStore
+
+
+def test_anonymous_visits_do_not_evict_signed_in_sessions(app, make_user, login, monkeypatch):
+    monkeypatch.setattr(app.session_interface, 'store', SessionStore(maxsize=2, anonymous_maxsize=2))
+    make_user('alice')
+    alice = login('alice')
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', True)
+    for _ in range(10):
+        # Each visit leaves a session holding only a CSRF token. The test's
+        # app context outlives requests, so drop the token Flask-WTF keeps in g
+        g.pop('csrf_token', None)
+        assert app.test_client().get('/login').status_code == 200
+
+    store = app.session_interface.store
+    assert len(store.entries) == 1
+    assert len(store.anonymous) == 2
+    assert alice.get('/lobby').status_code == 200
+
+def test_session_moves_out_of_the_anonymous_lru():
+    store = SessionStore(maxsize=2, anonymous_maxsize=1)
+    store.set('sid', 'anonymous', expires_at=2e9, anonymous=True)
+    store.set('sid', 'signed in', expires_at=2e9)
+    assert 'sid' not in store.anonymous
+    assert store.get('sid') == 'signed in'
+    store.set('other', 'anonymous', expires_at=2e9, anonymous=True)
+    assert store.get('sid') == 'signed in'
+    assert store.purge() == 0
@@ -0,0 +1,113 @@
+"""Hierarchical timing wheel.
+
+Thousands of turn clocks can't each be a sleeping greenthread. The wheel
+keeps every timer in a bucket and one loop advances it a tick at a time:
+
+- time is counted in ticks and written in mixed radix, one digit per level
+  (the default four levels of 256, 64, 64 and 64 slots cover 67M ticks);
+- a timer goes in the level of the highest digit where its expiry differs
+  from the current tick, in the slot for that digit;
+- when a level's digit changes, the slot just reached is emptied and its
+  timers re-inserted one level down, and level 0 slots fire as they are
+  reached.
+
+Scheduling and cancelling are O(1); each tick costs the timers that fire or
+cascade in it. Timers beyond the wheel's span wait in an overflow bucket
+that is re-checked whenever the top level wraps.
+"""
+import time
+from threading import Lock
+
+
+class Timer:
+    __slots__ = ('expires', 'callback', 'args', 'bucket')
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires  # tick
+        self.callback = callback
+        self.args = args
+        self.bucket = None  # set the timer sits in; None once fired or cancelled
+
+
+class TimingWheel:
+    def __init__(self, tick=0.1, slots=(256, 64, 64, 64), clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = slots
+        self.granularity = [1]  # ticks per slot at each level
+        for size in slots:
+            self.granularity.append(self.granularity[-1] * size)
+        self.levels = [[set() for _ in range(size)] for size in slots]
+        self.overflow = set()
+        self.current = 0  # ticks since the wheel started
+        self.started = clock()
+        self.lock = Lock()
+
+    def __len__(self):
+        return sum(len(bucket) for level in self.levels for bucket in level) + len(self.overflow)
+
+    def schedule(self, delay, callback, *args):
+        # Fires callback(*args) from advance() once `delay` seconds have passed
+        with self.lock:
+            timer = Timer(self.current + max(1, int(-(-delay // self.tick))), callback, args)
+            self._insert(timer)
+            return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.bucket is None:
+                return False
+            timer.bucket.discard(timer)
+            timer.bucket = None
+            return True
+
+    def advance(self, now=None):
+        """Run every tick up to `now`, firing due timers; returns how many
+        fired. Callbacks run outside the lock and may schedule or cancel."""
+        target = int(((self.clock() if now is None else now) - self.started) / self.tick)
+        fired = 0
+        while self.current < target:
+            with self.lock:
+                self.current += 1
+                due = self._tick()
+            for timer in due:
+                fired += 1
+                timer.callback(*timer.args)
+        return fired
+
+    def _tick(self):
+        # Cascade every level whose digit just changed, highest first
+        for level in range(len(self.slots) - 1, 0, -1):
+            if self.current % self.granularity[level] == 0:
+                self._cascade(level)
+        if self.current % self.granularity[-1] == 0 and self.overflow:
+            overflow, self.overflow = self.overflow, set()
+            for timer in overflow:
+                self._insert(timer)
+
+        bucket = self.levels[0][self.current % self.slots[0]]
+        due = [timer for timer in bucket if timer.expires <= self.current]
+        for timer in due:
+            bucket.discard(timer)
+            timer.bucket = None
+        return due
+
+    def _cascade(self, level):
+        index = (self.current // self.granularity[level]) % self.slots[level]
+        bucket = self.levels[level][index]
+        self.levels[level][index] = set()
+        for timer in bucket:
+            self._insert(timer)
+
+    def _insert(self, timer):
+        # A timer already due lands in the level 0 slot being processed
+        expires = max(timer.expires, self.current)
+        for level in range(len(self.slots) - 1, -1, -1):
+            if expires // self.granularity[level] != self.current // self.granularity[level]:
+                break
+        if expires // self.granularity[-1] != self.current // self.granularity[-1]:
+            bucket = self.overflow
+        else:
+            bucket = self.levels[level][(expires // self.granularity[level]) % self.slots[level]]
+        bucket.add(timer)
+        timer.bucket = bucket
@@ -0,0 +1,191 @@
+"""Round-robin tournaments between computer policies.
+
+Every pair of policies plays the same seeded deals twice, once from each
+seat, and the results are rated with the Elo formula live matches use:
+
+    python tournament.py                              # every policy, 1000 games per pairing
+    python tournament.py -p greedy -p endgame --games 5000
+    python tournament.py --workers 8 --seed 42
+
+Games are split into chunks played by a process pool; each worker builds
+its policies once and keeps them (and the endgame solver's cache) for every
+chunk it plays, so throughput grows with the number of cores. Ratings are
+applied in game order after all chunks are in, so they don't depend on
+which worker finished first.
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+from itertools import combinations
+from multiprocessing import Pool
+
+from ai import best_placement
+from engine import Game, CharacterCard, first_empty_cell
+from rating import get_k_factor, calculate_rating_change
+from solver import EndgameSolver
+
+START_RATING = 1000
+MAX_TURNS = 100  # a game that isn't over by then (nobody can place) counts as a tie
+
+
+def random_placement(game):
+    # Any character card in any empty cell, reproducible from the game's seed
+    player = game.player1 if game.current_turn == game.player1.name else game.player2
+    cards = [card for card in player.hand if isinstance(card, CharacterCard)]
+    cells = [(row, col) for row in range(3) for col in range(5) if game.grid[row][col] is None]
+    if not cards or not cells:
+        return None
+    rng = game.rng('tournament')
+    return (rng.choice(cards),) + rng.choice(cells)
+
+def endgame_policy():
+    # The server's computer: best placement, then perfect play near the end
+    solver = EndgameSolver()
+    def policy(game):
+        move = solver.best_move(game)
+        return move[:3] if move else best_placement(game)
+    return policy
+
+# Policy name -> factory returning policy(game) -> (card, row, col) or None
+POLICIES = {
+    'first_empty_cell': lambda: first_empty_cell,
+    'random': lambda: random_placement,
+    'greedy': lambda: best_placement,
+    'endgame': endgame_policy,
+}
+
+policies = {}  # built once per worker process
+
+def init_worker(names):
+    for name in names:
+        policies[name] = POLICIES[name]()
+
+def play_game(first, second, seed):
+    """Play one game with `first` moving first. Returns the winning policy's
+    name (None for a tie) and each policy's move latencies in seconds."""
+    game = Game(first, second, seed=seed)
+    latencies = {first: [], second: []}
+    for _ in range(MAX_TURNS):
+        if game.winner:
+            break
+        name = game.current_turn
+        started = time.perf_counter()
+        placement = policies[name](game)
+        latencies[name].append(time.perf_counter() - started)
+        if placement:
+            card, row, col = placement
+            game.play_card(card.to_json(), row, col, name)
+        game.end_turn()
+    winner = game.winner if game.winner in (first, second) else None
+    return winner, latencies
+
+def play_chunk(task):
+    # Both seatings of each deal in the chunk
+    index, pairing, seeds = task
+    results = []
+    latencies = defaultdict(list)
+    for seed in seeds:
+        for first, second in (pairing, pairing[::-1]):
+            winner, moves = play_game(first, second, seed)
+            results.append((seed, index, first, second, winner))
+            for name, samples in moves.items():
+                latencies[name].extend(samples)
+    return results, latencies
+
+def percentile(sorted_samples, pct):
+    # Nearest-rank percentile
+    if not sorted_samples:
+        return 0
+    index = max(0, int(round(pct / 100 * len(sorted_samples))) - 1)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+class Standings:
+    def __init__(self, names):
+        self.ratings = {name: START_RATING for name in names}
+        self.games = {name: 0 for name in names}
+        self.record = {name: [0, 0, 0] for name in names}  # wins, losses, ties
+        self.pairings = defaultdict(lambda: [0, 0, 0])  # (a, b) -> a wins, b wins, ties
+
+    def add(self, first, second, winner):
+        a, b = sorted((first, second))
+        if winner is None:
+            # calculate_rating_change has no draw case: a tie only counts as a game
+            self.pairings[(a, b)][2] += 1
+            for name in (first, second):
+                self.record[name][2] += 1
+                self.games[name] += 1
+            return
+        loser = second if winner == first else first
+        self.pairings[(a, b)][0 if winner == a else 1] += 1
+        self.record[winner][0] += 1
+        self.record[loser][1] += 1
+
+        # Same K-factor choice as a rated match between two players
+        k_factor = min(get_k_factor(self.games[winner]), get_k_factor(self.games[loser]))
+        change = calculate_rating_change(self.ratings[winner], self.ratings[loser], k_factor)
+        self.ratings[winner] += change
+        self.ratings[loser] = max(1, self.ratings[loser] - change)
+        self.games[winner] += 1
+        self.games[loser] += 1
+
+
+def run(names, games, workers, seed, chunk_size):
+    pairings = list(combinations(names, 2))
+    deals = (games + 1) // 2  # each deal is played from both seats
+    tasks = [(index, pairing, list(range(seed + start, seed + min(start + chunk_size, deals))))
+             for index, pairing in enumerate(pairings)
+             for start in range(0, deals, chunk_size)]
+
+    started = time.time()
+    results = []
+    latencies = defaultdict(list)
+    with Pool(workers, initializer=init_worker, initargs=(names,)) as pool:
+        for chunk_results, chunk_latencies in pool.imap_unordered(play_chunk, tasks):
+            results.extend(chunk_results)
+            for name, samples in chunk_latencies.items():
+                latencies[name].extend(samples)
+    elapsed = time.time() - started
+
+    # Rate in a fixed order, cycling through the pairings deal by deal
+    standings = Standings(names)
+    for _, _, first, second, winner in sorted(results, key=lambda result: (result[0], result[1], result[2])):
+        standings.add(first, second, winner)
+    return standings, latencies, len(results), elapsed
+
+def report(standings, latencies, played, elapsed, workers):
+    print(f"\n{'policy':<20}{'elo':>7}{'wins':>8}{'losses':>8}{'ties':>8}"
+          f"{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>10}")
+    for name in sorted(standings.ratings, key=standings.ratings.get, reverse=True):
+        samples = sorted(latencies[name])
+        wins, losses, ties = standings.record[name]
+        print(f"{name:<20}{standings.ratings[name]:>7}{wins:>8}{losses:>8}{ties:>8}"
+              f"{percentile(samples, 50) * 1e6:>10.1f}{percentile(samples, 90) * 1e6:>10.1f}"
+              f"{percentile(samples, 99) * 1e6:>10.1f}{(samples[-1] if samples else 0) * 1e6:>10.1f}")
+
+    print(f"\n{'pairing':<40}{'wins':>14}{'ties':>8}")
+    for (a, b), (a_wins, b_wins, ties) in sorted(standings.pairings.items()):
+        print(f"{a + ' vs ' + b:<40}{f'{a_wins} - {b_wins}':>14}{ties:>8}")
+
+    print(f"\n{played} games in {elapsed:.1f}s on {workers} worker(s): {played / elapsed:.0f} games/s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Play computer policies against each other')
+    parser.add_argument('-p', '--policy', dest='policies', action='append', choices=sorted(POLICIES),
+                        help='policy to enter (repeat for several; default: all)')
+    parser.add_argument('--games', type=int, default=1000, help='games per pairing')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first deal')
+    parser.add_argument('--chunk-size', type=int, default=25, help='deals per task handed to a worker')
+    args = parser.parse_args()
+
+    names = args.policies or sorted(POLICIES)
+    if len(set(names)) < 2:
+        parser.error('need at least two different policies')
+    names = sorted(set(names))
+    standings, latencies, played, elapsed = run(names, args.games, args.workers, args.seed, args.chunk_size)
+    report(standings, latencies, played, elapsed, args.workers)
+
+if __name__ == '__main__':
+    main()
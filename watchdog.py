@@ -0,0 +1,126 @@
+"""Event-loop watchdog for the eventlet server.
+
+Every greenthread shares the hub, so a handler that runs without yielding
+(PBKDF2, a SQLite commit, a bot turn) freezes every connected client. The
+watchdog records:
+
+- loop lag: a greenthread sleeps for `interval` and measures how late it
+  wakes up;
+- stalls: a native thread notices when that greenthread has not woken for
+  `threshold` seconds and logs the stack the hub is stuck in;
+- blocking time: greenlet.settrace times each slice a greenthread runs
+  between switches, and the longest slice of every request or socket event
+  is observed per handler.
+"""
+import sys
+import traceback
+from collections import deque
+from datetime import datetime
+
+import greenlet
+
+try:
+    # The monitor must stay a real OS thread even if eventlet patched threading
+    from eventlet.patcher import original
+    _threading = original('threading')
+    _time = original('time')
+except ImportError:
+    import threading as _threading
+    import time as _time
+
+STALL_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class LoopWatchdog:
+    def __init__(self, metrics, interval=0.1, threshold=0.25, keep_stalls=20):
+        self.metrics = metrics
+        self.interval = interval
+        self.threshold = threshold
+        self.handlers = {}  # greenlet -> [handler name, longest slice so far]
+        self.current = None  # greenlet holding the hub
+        self.slice_started = 0.0
+        self.heartbeat = 0.0
+        self.recent_stalls = deque(maxlen=keep_stalls)
+        self.main_thread_id = None
+        self.previous_trace = None
+        self.monitor = None
+        self.running = False
+        self.loop_lag = metrics.histogram(
+            'smash_event_loop_lag_seconds', 'How late the event loop wakes a sleeping greenthread',
+            buckets=STALL_BUCKETS)
+        self.stalls = metrics.counter(
+            'smash_event_loop_stalls_total', 'Times a greenthread held the event loop past the threshold',
+            ('handler',))
+        self.blocking = metrics.histogram(
+            'smash_handler_blocking_seconds',
+            'Longest time a request or socket event ran without yielding to the event loop', ('handler',),
+            STALL_BUCKETS)
+
+    def start(self, socketio):
+        if self.running:
+            return False
+        self.metrics.handler_hooks.append(self)
+        self.running = True
+        self.main_thread_id = _threading.get_ident()
+        self.heartbeat = self.slice_started = _time.perf_counter()
+        self.current = greenlet.getcurrent()
+        self.previous_trace = greenlet.settrace(self._trace)
+        socketio.start_background_task(self._tick, socketio)
+        self.monitor = _threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self.monitor.start()
+        return True
+
+    # Called by Metrics.start_handler / finish_handler in the handler's greenthread
+    def handler_started(self, handler):
+        self.handlers[greenlet.getcurrent()] = [handler, 0.0]
+
+    def handler_finished(self, handler):
+        entry = self.handlers.pop(greenlet.getcurrent(), None)
+        if entry is not None:
+            self.blocking.observe(max(entry[1], _time.perf_counter() - self.slice_started), entry[0])
+
+    def _trace(self, event, args):
+        if event in ('switch', 'throw'):
+            origin, target = args
+            now = _time.perf_counter()
+            entry = self.handlers.get(origin)
+            if entry is not None and now - self.slice_started > entry[1]:
+                entry[1] = now - self.slice_started
+            self.current = target
+            self.slice_started = now
+        if self.previous_trace is not None:
+            self.previous_trace(event, args)
+
+    def _tick(self, socketio):
+        while self.running:
+            started = _time.perf_counter()
+            socketio.sleep(self.interval)
+            now = _time.perf_counter()
+            self.loop_lag.observe(max(0.0, now - started - self.interval))
+            self.heartbeat = now
+
+    def _watch(self):
+        reported = None
+        while self.running:
+            _time.sleep(self.interval / 2)
+            heartbeat = self.heartbeat
+            stalled_for = _time.perf_counter() - heartbeat - self.interval
+            # Report each stall once, while the offender is still on the stack
+            if stalled_for >= self.threshold and reported != heartbeat:
+                reported = heartbeat
+                self._report_stall(stalled_for)
+
+    def _report_stall(self, stalled_for):
+        entry = self.handlers.get(self.current)
+        handler = entry[0] if entry else 'other'
+        frame = sys._current_frames().get(self.main_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+        self.stalls.inc(handler)
+        self.recent_stalls.append({
+            'handler': handler,
+            'blocked_ms': round(stalled_for * 1000),
+            'at': datetime.utcnow().isoformat(),
+            'stack': stack
+        })
+        print(f"Event loop blocked for {stalled_for * 1000:.0f}ms by {handler}:\n{stack}")
+